@@ -0,0 +1,90 @@
+"""Допуск команд в очередь сервера.
+
+Очередь ограничена по длине, а пользователи и имена процессов — по
+частоте команд (token bucket). Отклонённая команда получает ответ busy
+со временем, через которое стоит повторить запрос.
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst в запасе"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """0, если токен взят, иначе время (с) до появления токена"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """Token bucket на каждый ключ; rate = 0 отключает ограничение"""
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.max_keys = max_keys
+        self.buckets = {}
+
+    def take(self, key, now):
+        if self.rate <= 0:
+            return 0.0
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket.take(now)
+
+    def refund(self, key):
+        """Возврат токена, если команду отклонил другой ограничитель"""
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = min(bucket.burst, bucket.tokens + 1)
+
+    def _prune(self, now):
+        # Полные корзины ничем не отличаются от новых
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if not bucket.full(now)}
+
+
+class AdmissionControl:
+    """Решение о приёме команды: None — принять, иначе (причина, retry_after).
+
+    max_pending ограничивает число команд, ожидающих выполнения;
+    при его превышении клиенту предлагается подождать queue_retry секунд.
+    """
+
+    def __init__(self, max_pending=0, queue_retry=2.0, user_rate=0.0, user_burst=10,
+                 process_rate=0.0, process_burst=50):
+        self.max_pending = max_pending
+        self.queue_retry = queue_retry
+        self.users = RateLimiter(user_rate, user_burst)
+        self.processes = RateLimiter(process_rate, process_burst)
+        self.lock = threading.Lock()
+
+    def check(self, username, process_name, pending):
+        if self.max_pending and pending >= self.max_pending:
+            return 'queue', self.queue_retry
+        now = time.monotonic()
+        with self.lock:
+            wait = self.users.take(username, now)
+            if wait:
+                return 'user', wait
+            wait = self.processes.take(process_name, now)
+            if wait:
+                self.users.refund(username)
+                return 'process', wait
+        return None
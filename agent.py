@@ -0,0 +1,106 @@
+import threading
+import time
+from loguru import logger
+from client import EKillerClient, agent_address, agent_key_path, get_username
+from ipc import listen, session_id, write_key
+
+
+class EKillerAgent:
+    """Агент сеанса пользователя.
+
+    Держит постоянное подключение к EKillerServer (с переподключением
+    раз в reconnect_interval секунд) и принимает команды от лаунчеров
+    client.py по локальному IPC, поэтому повторный запуск программы в
+    сеансе стоит только локального обмена сообщениями.
+    """
+
+    def __init__(self, config_path='settings.inf'):
+        self.client = EKillerClient(config_path)
+        self.reconnect_interval = self.client.config.getfloat('Server', 'reconnect_interval', fallback=5.0)
+        self.address = agent_address(get_username(), session_id())
+        self.key_path = agent_key_path(self.client.config)
+        self.connect_lock = threading.Lock()
+        # Текстовый протокол не различает ответы, поэтому команды идут по одной
+        self.text_lock = threading.Lock()
+        self.listener = None
+        self.running = False
+
+    def is_connected(self):
+        if not self.client.connected:
+            return False
+        return self.client.channel is None or not self.client.channel.closed
+
+    def ensure_connected(self):
+        """Подключение к серверу, если соединение потеряно"""
+        with self.connect_lock:
+            if self.is_connected():
+                return True
+            self.client.close()
+            self.client.channel = None
+            return self.client.connect_to_server()
+
+    def keep_connected(self):
+        while self.running:
+            if not self.ensure_connected():
+                logger.warning(f"Нет связи с сервером, повтор через {self.reconnect_interval} с")
+            time.sleep(self.reconnect_interval)
+
+    def handle_launcher(self, conn):
+        """Команда от лаунчера: завершить и перезапустить программу"""
+        try:
+            message = conn.recv()
+            process_path = message.get('path')
+            companions = message.get('companions')
+            logger.info(f"Команда от лаунчера: {process_path}")
+            if not self.ensure_connected():
+                conn.send({'ok': False, 'error': "Нет подключения к серверу"})
+                return
+            if self.client.channel:
+                ok = self.client.kill_process(process_path, companions)
+            else:
+                with self.text_lock:
+                    ok = self.client.kill_process(process_path, companions)
+                if not ok:
+                    # В текстовом режиме обрыв связи виден только по ошибке
+                    self.client.connected = False
+            conn.send({'ok': ok})
+        except (EOFError, OSError) as e:
+            logger.warning(f"Лаунчер отключился: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка при обработке команды лаунчера: {e}")
+        finally:
+            conn.close()
+
+    def serve_forever(self):
+        # Новый ключ IPC для каждого запуска агента
+        self.listener = listen(self.address, write_key(self.key_path))
+        self.running = True
+        logger.info(f"Агент сеанса запущен: {self.address}")
+        keeper = threading.Thread(target=self.keep_connected, name='ekiller-agent-reconnect')
+        keeper.daemon = True
+        keeper.start()
+        while self.running:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                if self.running:
+                    logger.warning(f"Отклонено подключение лаунчера: {e}")
+                continue
+            handler = threading.Thread(target=self.handle_launcher, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def stop(self):
+        self.running = False
+        if self.listener:
+            self.listener.close()
+        self.client.close()
+        logger.info("Агент сеанса остановлен")
+
+
+if __name__ == "__main__":
+    agent = EKillerAgent('settings.inf')
+    try:
+        agent.serve_forever()
+    except KeyboardInterrupt:
+        agent.stop()
@@ -0,0 +1,171 @@
+"""Асинхронный журнал сервера.
+
+Потоки, обрабатывающие команды, только кладут строки в ограниченный
+буфер; запись на диск идёт пачками в отдельном потоке раз в
+flush_interval секунд. Так задержки диска не попадают во время
+завершения процессов.
+"""
+import datetime
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+OVERFLOW_POLICIES = ('drop', 'block')
+# Уровень WARNING в loguru: такие сообщения не отбрасываются никогда
+URGENT_LEVEL = 30
+
+
+class DailyFile:
+    """Файл журнала с ежедневной ротацией и удалением старых копий"""
+
+    def __init__(self, path, retention_days=7):
+        self.path = path
+        self.retention_days = retention_days
+        self.file = None
+        self.opened_on = None
+
+    def write(self, lines):
+        today = datetime.date.today()
+        if self.file is not None and self.opened_on != today:
+            self.rotate()
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+            self.opened_on = today
+        self.file.write(''.join(lines))
+        self.file.flush()
+
+    def rotate(self):
+        self.file.close()
+        self.file = None
+        base, ext = os.path.splitext(self.path)
+        os.replace(self.path, f"{base}.{self.opened_on.isoformat()}{ext}")
+        cutoff = time.time() - self.retention_days * 86400
+        for old in glob.glob(f"{glob.escape(base)}.*{ext}"):
+            if os.path.getmtime(old) < cutoff:
+                os.remove(old)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class AuditLog:
+    """Буферизованная запись журнала и событий завершения.
+
+    sink подключается к loguru вместо файлового обработчика, event пишет
+    компактную JSON-строку в отдельный файл событий (если он задан).
+
+    При заполнении буфера (buffer_size строк) действует политика overflow:
+    drop — отбросить сообщение и учесть его в счётчике dropped,
+    block — ждать, пока поток записи освободит место. Предупреждения и
+    ошибки при любой политике ждут места, а не отбрасываются.
+    """
+
+    def __init__(self, path='server.log', events_path=None, buffer_size=10000,
+                 flush_interval=0.5, overflow='drop', retention_days=7):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow должен быть одним из {OVERFLOW_POLICIES}: {overflow}")
+        self.files = {'log': DailyFile(path, retention_days)}
+        if events_path:
+            self.files['events'] = DailyFile(events_path, retention_days)
+        self.buffer = queue.Queue(maxsize=buffer_size)
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+        self.reported_dropped = 0
+        # После close() строки не пишутся, а учитываются как отброшенные
+        self.closed = False
+        self.written = 0
+        # Поток записи просыпается раньше, если буфер заполнен наполовину
+        self.high_water = max(1, buffer_size // 2)
+        self.wake = threading.Event()
+        self.write_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._write_loop, name='ekiller-audit')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def sink(self, message):
+        """Обработчик loguru: строка уже отформатирована"""
+        self.put('log', str(message), urgent=message.record['level'].no >= URGENT_LEVEL)
+
+    def event(self, kind, **fields):
+        """Структурированное событие (JSON lines) в файл событий"""
+        if 'events' not in self.files:
+            return
+        record = {'ts': datetime.datetime.now().isoformat(timespec='milliseconds'), 'event': kind}
+        record.update(fields)
+        self.put('events', json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def put(self, stream, line, urgent=False):
+        if self.closed:
+            # Файлы уже закрыты, а поток записи завершён
+            self.count_dropped(1)
+            return
+        try:
+            if self.overflow == 'block' or urgent:
+                self.buffer.put((stream, line))
+            else:
+                self.buffer.put_nowait((stream, line))
+        except queue.Full:
+            self.count_dropped(1)
+            return
+        if self.buffer.qsize() >= self.high_water:
+            self.wake.set()
+
+    def count_dropped(self, count):
+        with self.dropped_lock:
+            self.dropped += count
+
+    def pending(self):
+        return self.buffer.qsize()
+
+    def _write_loop(self):
+        while not self.stop_event.is_set():
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Запись накопленных строк: по одному обращению к каждому файлу"""
+        batches = {}
+        while True:
+            try:
+                stream, line = self.buffer.get_nowait()
+            except queue.Empty:
+                break
+            batches.setdefault(stream, []).append(line)
+        dropped = self.dropped
+        if dropped != self.reported_dropped:
+            batches.setdefault('log', []).append(
+                f"{datetime.datetime.now().isoformat(sep=' ', timespec='milliseconds')} | WARNING  | audit - "
+                f"буфер журнала переполнен, отброшено сообщений: {dropped - self.reported_dropped}\n"
+            )
+            self.reported_dropped = dropped
+        with self.write_lock:
+            for stream, lines in batches.items():
+                try:
+                    self.files[stream].write(lines)
+                    self.written += len(lines)
+                except OSError:
+                    # Журнал недоступен: процессы всё равно должны завершаться
+                    self.count_dropped(len(lines))
+                    self.reported_dropped += len(lines)
+
+    def close(self):
+        """Запись остатка буфера и остановка потока"""
+        self.stop_event.set()
+        self.wake.set()
+        self.thread.join()
+        self.closed = True
+        # Строки, попавшие в буфер после последней записи потока
+        self.flush()
+        with self.write_lock:
+            for file in self.files.values():
+                file.close()
@@ -0,0 +1,123 @@
+"""Бенчмарк времени запуска клиента: режим без Qt против режима со сплэш-скрином.
+
+Поднимает server.py на временном порту и несколько раз запускает client.py
+в каждом режиме, измеряя время от старта процесса до его завершения
+(подключение, завершение процесса, перезапуск программы, подтверждение).
+
+    python benchmarks/client_startup.py --runs 5
+
+Режим со сплэш-скрином требует PySide6; без дисплея используется
+QT_QPA_PLATFORM=offscreen. Если PySide6 не установлен, режим пропускается.
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = """[Server]
+host = 127.0.0.1
+port = {port}
+
+[Process]
+defaultpath = {program}
+restart_delay = 5
+startup_probe = 0.2
+
+[Logging]
+log_path = {workdir}/client.log
+rotation = 1 day
+retention = 1 day
+
+[Splash]
+duration = {duration}
+logo_path = {logo}
+logo_size = 300
+"""
+
+
+def harmless_program():
+    """Программа, которую безопасно «перезапускать» в бенчмарке"""
+    if sys.platform == 'win32':
+        return os.path.join(os.environ.get('SystemRoot', r'C:\Windows'), 'System32', 'hostname.exe')
+    return shutil.which('true')
+
+
+def client_command(headless):
+    command = [sys.executable, os.path.join(ROOT, 'client.py')]
+    if headless:
+        command.append('--headless')
+    # Клиент завершает родительский процесс, поэтому запускаем его через оболочку
+    if sys.platform == 'win32':
+        return ['cmd', '/c'] + command
+    return ['sh', '-c', subprocess.list2cmdline(command) + '; exit $?']
+
+
+def run_once(workdir, headless):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    started = time.perf_counter()
+    subprocess.run(
+        client_command(headless), cwd=workdir, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return time.perf_counter() - started
+
+
+def report(name, samples):
+    print(
+        f"{name:>10}: n={len(samples)} "
+        f"min={min(samples) * 1000:.0f} ms "
+        f"median={statistics.median(samples) * 1000:.0f} ms "
+        f"mean={statistics.mean(samples) * 1000:.0f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время запуска клиента в разных режимах")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=5910)
+    parser.add_argument('--duration', type=int, default=2000, help="длительность сплэш-скрина, мс")
+    parser.add_argument('--settle', type=float, default=5.5, help="пауза между запусками, с")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'settings.inf'), 'w', encoding='utf-8') as f:
+            f.write(SETTINGS.format(
+                port=args.port,
+                program=harmless_program(),
+                workdir=workdir.replace('\\', '/'),
+                duration=args.duration,
+                logo=os.path.join(ROOT, 'img', 'logo.png'),
+            ))
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'server.py')],
+            cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            time.sleep(1.5)
+            modes = [('headless', True)]
+            if importlib.util.find_spec('PySide6') is not None:
+                modes.append(('splash', False))
+            else:
+                print("PySide6 не установлен, режим со сплэш-скрином пропущен")
+            for name, headless in modes:
+                samples = []
+                for _ in range(args.runs):
+                    samples.append(run_once(workdir, headless))
+                    # Сервер держит очередь ещё 5 с после подтверждения запуска
+                    time.sleep(args.settle)
+                report(name, samples)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
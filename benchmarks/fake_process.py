@@ -0,0 +1,158 @@
+"""Подменная таблица процессов для нагрузочных бенчмарков сервера.
+
+FakeProcessTable повторяет ту часть API psutil, которой пользуется
+EKillerServer (pids, Process, process_iter, wait_procs), и передаётся
+серверу вместо модуля psutil:
+
+    table = FakeProcessTable(exit_delay=0.05)
+    table.spawn('excel.exe', 'ivanov')
+    server = EKillerServer('settings.inf', process_table=table)
+
+Так можно гонять тысячи команд завершения, не трогая настоящие процессы.
+"""
+import itertools
+import random
+import threading
+import time
+import psutil
+
+
+class FakeProcess:
+    """Процесс фиктивной таблицы; после kill() завершается через exit_delay"""
+
+    def __init__(self, table, pid, name, username, create_time, ppid=0):
+        self.table = table
+        self.pid = pid
+        self.ppid = ppid
+        self._name = name
+        self._username = username
+        self._create_time = create_time
+        self.exit_at = None
+        self.info = {'pid': pid, 'name': name, 'ppid': ppid}
+
+    def _check(self):
+        if not self.is_running():
+            raise psutil.NoSuchProcess(self.pid, self._name)
+
+    def name(self):
+        self._check()
+        return self._name
+
+    def username(self):
+        self._check()
+        return self._username
+
+    def create_time(self):
+        self._check()
+        return self._create_time
+
+    def children(self, recursive=False):
+        return self.table.children(self, recursive)
+
+    def is_running(self):
+        return self.exit_at is None or time.monotonic() < self.exit_at
+
+    def kill(self):
+        self._check()
+        self.table.kill(self)
+
+    terminate = kill
+
+    def __repr__(self):
+        return f"FakeProcess(pid={self.pid}, name={self._name!r}, user={self._username!r})"
+
+
+class FakeProcessTable:
+    """Таблица процессов в памяти с API, совместимым с нужной серверу частью psutil.
+
+    exit_delay — сколько «живёт» процесс после kill(), stuck — доля
+    процессов, не завершающихся вовсе (проверка kill_timeout).
+    """
+
+    def __init__(self, exit_delay=0.0, stuck=0.0, seed=None):
+        self.exit_delay = exit_delay
+        self.stuck = stuck
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.procs = {}
+        self.next_pid = itertools.count(1000)
+        self.kills = 0
+
+    def spawn(self, name, username='user', parent=None):
+        """Новый процесс с указанным именем и владельцем (потомок parent, если задан)"""
+        with self.lock:
+            pid = next(self.next_pid)
+            proc = FakeProcess(self, pid, name, username, time.time(), parent.pid if parent else 0)
+            self.procs[pid] = proc
+        return proc
+
+    def populate(self, count, names, users):
+        """count процессов со случайными именами и владельцами"""
+        for _ in range(count):
+            self.spawn(self.random.choice(names), self.random.choice(users))
+
+    def kill(self, proc):
+        with self.lock:
+            self.kills += 1
+            if self.stuck and self.random.random() < self.stuck:
+                return
+            if proc.exit_at is None:
+                proc.exit_at = time.monotonic() + self.exit_delay
+
+    def children(self, proc, recursive=False):
+        with self.lock:
+            self._reap()
+            procs = list(self.procs.values())
+        found = [child for child in procs if child.ppid == proc.pid]
+        if recursive:
+            for child in list(found):
+                found += child.children(recursive=True)
+        return found
+
+    def _reap(self):
+        # Вызывается под self.lock: убираем завершившиеся процессы
+        now = time.monotonic()
+        for pid in [pid for pid, proc in self.procs.items()
+                    if proc.exit_at is not None and proc.exit_at <= now]:
+            del self.procs[pid]
+
+    def pids(self):
+        with self.lock:
+            self._reap()
+            return list(self.procs)
+
+    def Process(self, pid):
+        with self.lock:
+            self._reap()
+            proc = self.procs.get(pid)
+        if proc is None:
+            raise psutil.NoSuchProcess(pid)
+        return proc
+
+    def process_iter(self, attrs=None):
+        with self.lock:
+            self._reap()
+            return iter(list(self.procs.values()))
+
+    def wait_procs(self, procs, timeout=None):
+        """(завершившиеся, живые) — как psutil.wait_procs"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            alive = [proc for proc in procs if proc.is_running()]
+            now = time.monotonic()
+            if not alive or (deadline is not None and now >= deadline):
+                break
+            exits = [proc.exit_at for proc in alive if proc.exit_at is not None]
+            if len(exits) == len(alive):
+                wake = max(exits)
+            elif deadline is None:
+                # Зависший процесс без таймаута: psutil ждал бы вечно
+                break
+            else:
+                wake = deadline
+            if deadline is not None:
+                wake = min(wake, deadline)
+            time.sleep(max(0.0, wake - now))
+        gone = [proc for proc in procs if not proc.is_running()]
+        alive = [proc for proc in procs if proc.is_running()]
+        return gone, alive
@@ -0,0 +1,75 @@
+"""Регрессионный бенчмарк: загрузка процессора сервером в простое.
+
+Запускает server.py в отдельном процессе с временным settings.inf,
+ждёт прогрева и измеряет процессорное время за интервал без клиентов.
+
+    python benchmarks/idle_cpu.py --duration 10 --threshold 2
+
+Код возврата 1, если загрузка выше порога (в процентах одного ядра).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import psutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETTINGS = """[Server]
+host = 127.0.0.1
+port = {port}
+mode = {mode}
+"""
+
+
+def measure_idle_cpu(duration, mode, port, warmup=2.0):
+    """Процент загрузки одного ядра процессом сервера за duration секунд"""
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'settings.inf'), 'w', encoding='utf-8') as f:
+            f.write(SETTINGS.format(port=port, mode=mode))
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'server.py')],
+            cwd=workdir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            proc = psutil.Process(server.pid)
+            time.sleep(warmup)
+            if server.poll() is not None:
+                raise RuntimeError(f"Сервер завершился с кодом {server.returncode}")
+            before = proc.cpu_times()
+            started = time.monotonic()
+            time.sleep(duration)
+            after = proc.cpu_times()
+            elapsed = time.monotonic() - started
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                server.kill()
+    used = (after.user - before.user) + (after.system - before.system)
+    return used / elapsed * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка процессора сервером в простое")
+    parser.add_argument('--duration', type=float, default=10.0, help="длительность замера, с")
+    parser.add_argument('--threshold', type=float, default=2.0, help="допустимая загрузка, %% ядра")
+    parser.add_argument('--mode', default='threaded', choices=['threaded', 'asyncio'])
+    parser.add_argument('--port', type=int, default=5900)
+    args = parser.parse_args()
+
+    cpu = measure_idle_cpu(args.duration, args.mode, args.port)
+    print(f"mode={args.mode} idle_cpu={cpu:.2f}% threshold={args.threshold:.2f}%")
+    if cpu > args.threshold:
+        print("РЕГРЕССИЯ: сервер нагружает процессор в простое")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""Нагрузочный бенчмарк сервера: задержки и пропускная способность под нагрузкой.
+
+Запускает EKillerServer в этом же процессе поверх фиктивной таблицы
+процессов (benchmarks/fake_process.py) и моделирует N клиентов, которые
+по выбранному сценарию прихода подключаются, просят завершить процесс,
+«перезапускают» его и подтверждают запуск. Для каждой фазы протокола
+печатаются p50/p95/p99, результаты можно сохранить в JSON.
+
+    python benchmarks/load.py --clients 500 --pattern storm --protocol framed
+    python benchmarks/load.py --pattern steady --rate 50 --output results.json
+
+Сценарии прихода:
+    storm  — «утренний вход»: все клиенты в течение --ramp секунд;
+    steady — поток Пуассона с интенсивностью --rate клиентов в секунду;
+    burst  — пачки по --burst-size клиентов раз в --burst-interval секунд.
+
+Фазы: connect — установка соединения (и приветствие кадрового протокола),
+reply — от команды kill до ok-taskkill, total — от начала подключения
+до отправки taskstart-ok.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from loguru import logger  # noqa: E402
+from fake_process import FakeProcessTable  # noqa: E402
+from protocol import HELLO_SIZE, FrameDecoder, encode_frame, hello, parse_hello  # noqa: E402
+from server import EKillerServer  # noqa: E402
+
+PHASES = ('connect', 'reply', 'total')
+
+SETTINGS = """[Server]
+host = 127.0.0.1
+port = {port}
+mode = {mode}
+backlog = {backlog}
+kill_timeout = {kill_timeout}
+kill_scope = {kill_scope}
+kill_tree = {kill_tree}
+kill_grace = {kill_grace}
+
+[Scheduler]
+workers = {workers}
+conflict_key = {conflict_key}
+coalesce_window = {coalesce_window}
+settle_delay = {settle_delay}
+
+[Index]
+enabled = {index}
+
+[Handoff]
+enabled = no
+"""
+
+
+def arrival_times(args, rng):
+    """Моменты подключения клиентов (секунды от начала прогона)"""
+    if args.pattern == 'storm':
+        return sorted(rng.uniform(0, args.ramp) for _ in range(args.clients))
+    if args.pattern == 'steady':
+        times, now = [], 0.0
+        for _ in range(args.clients):
+            now += rng.expovariate(args.rate)
+            times.append(now)
+        return times
+    return [(i // args.burst_size) * args.burst_interval for i in range(args.clients)]
+
+
+class SimulatedClient:
+    """Один клиент: подключение, kill, перезапуск программы, taskstart-ok"""
+
+    def __init__(self, args, table, username, process_name):
+        self.args = args
+        self.table = table
+        self.username = username
+        self.process_name = process_name
+        self.timings = {}
+        self.error = None
+
+    async def run(self):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.exchange(started), timeout=self.args.timeout)
+        except asyncio.TimeoutError:
+            self.error = 'timeout'
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    async def exchange(self, started):
+        reader, writer = await asyncio.open_connection(self.args.host, self.args.port)
+        try:
+            if self.args.protocol == 'framed':
+                writer.write(hello())
+                await writer.drain()
+                if parse_hello(await reader.readexactly(HELLO_SIZE)) is None:
+                    raise ConnectionError("сервер не ответил на приветствие")
+            self.timings['connect'] = time.perf_counter() - started
+            sent = time.perf_counter()
+            if self.args.protocol == 'framed':
+                await self.kill_framed(reader, writer)
+            else:
+                await self.kill_text(reader, writer)
+            self.timings['reply'] = time.perf_counter() - sent
+            # Перезапуск программы: новый процесс появляется через launch_delay
+            await asyncio.sleep(self.args.launch_delay)
+            self.table.spawn(self.process_name, self.username)
+            if self.args.protocol == 'framed':
+                writer.write(encode_frame({'id': 1, 'cmd': 'taskstart-ok'}))
+            else:
+                writer.write(b"taskstart-ok")
+            await writer.drain()
+            self.timings['total'] = time.perf_counter() - started
+        finally:
+            writer.close()
+
+    async def kill_framed(self, reader, writer):
+        writer.write(encode_frame({'id': 1, 'cmd': 'kill', 'name': self.process_name, 'user': self.username}))
+        await writer.drain()
+        decoder = FrameDecoder()
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                raise ConnectionError("сервер закрыл соединение")
+            for message in decoder.feed(data):
+                if message.get('id') == 1:
+                    if message.get('status') != 'ok-taskkill':
+                        raise ConnectionError(f"ответ сервера: {message}")
+                    return
+
+    async def kill_text(self, reader, writer):
+        writer.write(f"{self.username}_kill:{self.process_name}".encode('utf-8'))
+        await writer.drain()
+        data = await reader.read(1024)
+        if not data.startswith(b"ok-taskkill"):
+            raise ConnectionError(f"ответ сервера: {data!r}")
+
+
+def summarize(samples):
+    """Количество, среднее и перцентили в миллисекундах"""
+    if not samples:
+        return {'count': 0}
+    ms = sorted(sample * 1000 for sample in samples)
+    if len(ms) > 1:
+        cuts = statistics.quantiles(ms, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ms[0]
+    return {
+        'count': len(ms),
+        'mean': statistics.mean(ms),
+        'p50': p50,
+        'p95': p95,
+        'p99': p99,
+        'max': ms[-1],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def drive(args, table, rng):
+    names = args.names.split(',')
+    users = [f"user{i:04d}" for i in range(args.users)]
+    clients = []
+    for i, at in enumerate(arrival_times(args, rng)):
+        clients.append((at, SimulatedClient(args, table, users[i % len(users)], rng.choice(names))))
+    # У каждого клиента уже запущена программа, которую он попросит завершить
+    for _, client in clients:
+        proc = table.spawn(client.process_name, client.username)
+        for _ in range(args.children):
+            table.spawn('helper.exe', client.username, parent=proc)
+
+    started = time.perf_counter()
+
+    async def launch(at, client):
+        await asyncio.sleep(at)
+        await client.run()
+
+    await asyncio.gather(*(launch(at, client) for at, client in clients))
+    return [client for _, client in clients], time.perf_counter() - started
+
+
+def start_server(args, workdir, table):
+    with open(os.path.join(workdir, 'settings.inf'), 'w', encoding='utf-8') as f:
+        f.write(SETTINGS.format(
+            port=args.port, mode=args.mode, backlog=args.backlog,
+            kill_timeout=args.kill_timeout, kill_scope=args.kill_scope,
+            kill_tree='yes' if args.tree else 'no', kill_grace=args.kill_grace,
+            workers=args.workers, conflict_key=args.conflict_key,
+            coalesce_window=args.coalesce_window, settle_delay=args.settle_delay,
+            index='yes' if args.index else 'no',
+        ))
+    # server.log пишется в текущий каталог
+    os.chdir(workdir)
+    server = EKillerServer('settings.inf', process_table=table)
+    thread = threading.Thread(target=server.start, name='ekiller-server')
+    thread.daemon = True
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.running:
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("Сервер не запустился")
+        time.sleep(0.05)
+    return server
+
+
+def report(results):
+    print(f"клиентов: {results['clients']}, успешно: {results['completed']}, "
+          f"ошибок: {results['errors']}, за {results['wall_seconds']:.2f} с, "
+          f"{results['throughput']:.1f} клиентов/с")
+    for phase in PHASES:
+        stats = results['phases'][phase]
+        if not stats['count']:
+            continue
+        print(f"{phase:>8}: p50={stats['p50']:.1f} ms p95={stats['p95']:.1f} ms "
+              f"p99={stats['p99']:.1f} ms max={stats['max']:.1f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк сервера")
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--users', type=int, default=200, help="число разных пользователей")
+    parser.add_argument('--names', default='1cv8.exe,excel.exe,winword.exe', help="имена процессов через запятую")
+    parser.add_argument('--population', type=int, default=2000, help="посторонние процессы в таблице")
+    parser.add_argument('--pattern', choices=('storm', 'steady', 'burst'), default='storm')
+    parser.add_argument('--ramp', type=float, default=1.0, help="storm: длительность наплыва, с")
+    parser.add_argument('--rate', type=float, default=50.0, help="steady: клиентов в секунду")
+    parser.add_argument('--burst-size', type=int, default=50)
+    parser.add_argument('--burst-interval', type=float, default=1.0)
+    parser.add_argument('--protocol', choices=('framed', 'text'), default='framed')
+    parser.add_argument('--mode', choices=('threaded', 'asyncio'), default='asyncio')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5920)
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--conflict-key', default='both')
+    parser.add_argument('--coalesce-window', type=float, default=0.0)
+    parser.add_argument('--settle-delay', type=float, default=0.0, help="[Scheduler] settle_delay сервера, с")
+    parser.add_argument('--kill-scope', default='user')
+    parser.add_argument('--kill-timeout', type=float, default=10.0)
+    parser.add_argument('--tree', action='store_true', help="kill_tree = yes: завершать и потомков")
+    parser.add_argument('--kill-grace', type=float, default=3.0)
+    parser.add_argument('--children', type=int, default=0, help="потомков у каждой программы клиента")
+    parser.add_argument('--no-index', dest='index', action='store_false')
+    parser.add_argument('--exit-delay', type=float, default=0.02, help="время выхода процесса после kill, с")
+    parser.add_argument('--launch-delay', type=float, default=0.05, help="время «запуска» программы клиентом, с")
+    parser.add_argument('--timeout', type=float, default=120.0, help="предельное время одного клиента, с")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="файл для результатов в JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level='WARNING')
+    rng = random.Random(args.seed)
+    table = FakeProcessTable(exit_delay=args.exit_delay, seed=args.seed)
+    table.populate(args.population, [f"svc{i:03d}.exe" for i in range(100)], ['system'])
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        server = start_server(args, workdir, table)
+        try:
+            clients, wall = asyncio.run(drive(args, table, rng))
+            # Дожидаемся, пока сервер досчитает последние команды
+            deadline = time.monotonic() + 10
+            while server.in_flight.get() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            metrics = server.metrics.snapshot()
+        finally:
+            server.stop()
+            os.chdir(cwd)
+            logger.remove()
+
+    completed = [client for client in clients if client.error is None]
+    errors = {}
+    for client in clients:
+        if client.error:
+            errors[client.error] = errors.get(client.error, 0) + 1
+    results = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'config': vars(args),
+        'clients': len(clients),
+        'completed': len(completed),
+        'errors': sum(errors.values()),
+        'error_kinds': errors,
+        'wall_seconds': wall,
+        'throughput': len(completed) / wall if wall else 0.0,
+        'phases': {
+            phase: summarize([client.timings[phase] for client in completed if phase in client.timings])
+            for phase in PHASES
+        },
+        'kills': table.kills,
+        'server_metrics': metrics,
+    }
+    report(results)
+    if args.output:
+        with open(os.path.join(cwd, args.output), 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    if errors:
+        for kind, count in errors.items():
+            print(f"  {count} x {kind}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Бенчмарк дельта-обновлений: сколько байт скачивается вместо целого exe.
+
+Поднимает локальный HTTP-сервер с поддержкой Range (замена серверу
+обновлений), публикует на нём «новую версию» с манифестом блоков и
+собирает её из «старой» через updater/delta.py.
+
+    python benchmarks/update_delta.py --size 50 --changed 5
+    python benchmarks/update_delta.py --size 50 --changed 5 --insert 0
+
+--old/--new позволяют взять вместо синтетических файлов две настоящие
+сборки exe.
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'updater'))
+
+from delta import BLOCK_SIZE, download_delta, write_manifest  # noqa: E402
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Раздача файлов с поддержкой одного диапазона Range"""
+
+    served = 0
+
+    def do_GET(self):
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().do_GET()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {start}-{end}/{size}")
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        RangeHandler.served += len(data)
+
+    def copyfile(self, source, outputfile):
+        # Полная отдача файла без Range тоже учитывается
+        data = source.read()
+        outputfile.write(data)
+        RangeHandler.served += len(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def synthetic_versions(workdir, size_mb, changed_percent, inserted_kb, seed):
+    """Старая и новая версии: часть блоков изменена на месте, в середину вставлено inserted_kb КБ.
+
+    Вставка сдвигает вторую половину файла, как пересборка, в которой
+    изменился размер кода; блоки фиксированного размера после сдвига не
+    совпадают, и вторая половина скачивается заново.
+    """
+    rng = random.Random(seed)
+    old = bytearray(rng.randbytes(size_mb * 1024 * 1024))
+    new = bytearray(old)
+    blocks = len(new) // BLOCK_SIZE
+    for number in rng.sample(range(blocks), max(1, blocks * changed_percent // 100)):
+        start = number * BLOCK_SIZE + rng.randrange(BLOCK_SIZE - 16)
+        new[start:start + 16] = rng.randbytes(16)
+    if inserted_kb:
+        middle = len(new) // 2
+        new[middle:middle] = rng.randbytes(inserted_kb * 1024)
+    old_path = os.path.join(workdir, 'old.exe')
+    new_path = os.path.join(workdir, 'www', 'app.exe')
+    with open(old_path, 'wb') as f:
+        f.write(old)
+    with open(new_path, 'wb') as f:
+        f.write(new)
+    return old_path, new_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Объём скачивания при дельта-обновлении")
+    parser.add_argument('--size', type=int, default=50, help="размер синтетического exe, МБ")
+    parser.add_argument('--changed', type=int, default=5, help="доля изменённых блоков, %%")
+    parser.add_argument('--insert', type=int, default=32,
+                        help="КБ, вставленных в середину файла (0 — только изменения на месте)")
+    parser.add_argument('--old', help="старая сборка exe")
+    parser.add_argument('--new', help="новая сборка exe")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, 'www'))
+        if args.old and args.new:
+            old_path = args.old
+            new_path = os.path.join(workdir, 'www', 'app.exe')
+            shutil.copyfile(args.new, new_path)
+        else:
+            old_path, new_path = synthetic_versions(workdir, args.size, args.changed, args.insert, args.seed)
+        write_manifest(new_path)
+
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), partial(RangeHandler, directory=os.path.join(workdir, 'www')))
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{httpd.server_port}/app.exe"
+        try:
+            started = time.perf_counter()
+            reused, fetched = download_delta(url, old_path, os.path.join(workdir, 'app_new.tmp'))
+            elapsed = time.perf_counter() - started
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+        size = os.path.getsize(new_path)
+        print(f"новая версия: {size / 1048576:.1f} МБ")
+        print(f"переиспользовано из старой: {reused / 1048576:.1f} МБ")
+        print(f"скачано блоков: {fetched / 1048576:.2f} МБ, всего по сети с манифестом: "
+              f"{RangeHandler.served / 1048576:.2f} МБ ({RangeHandler.served * 100 / size:.1f}% от полного)")
+        print(f"время сборки: {elapsed:.2f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,84 +4,30 @@ import socket
 import subprocess
 import time
 import configparser
+import ctypes
+import argparse
+import getpass
+import threading
+import random
+from multiprocessing.connection import Client
 import psutil
-from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                            QLabel, QPushButton, QLineEdit, QMessageBox)
-from PySide6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve
-from PySide6.QtGui import QPixmap, QPainter, QColor
 from loguru import logger
 import signal
-
-class SplashScreen(QWidget):
-    def __init__(self, logo_path, logo_size, duration):
-        super().__init__()
-        logger.info(f"Инициализация сплэш-скрина: logo_path={logo_path}, size={logo_size}, duration={duration}")
-        
-        self.setWindowFlags(Qt.FramelessWindowHint)
-        self.setAttribute(Qt.WA_TranslucentBackground)
-        
-        # Создаем layout
-        layout = QVBoxLayout()
-        layout.setAlignment(Qt.AlignCenter)
-        self.setLayout(layout)
-        
-        # Создаем и настраиваем логотип
-        self.logo_label = QLabel()
-        self.logo_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(self.logo_label)
-        
-        # Загружаем и устанавливаем логотип
-        if not os.path.exists(logo_path):
-            logger.error(f"Файл логотипа не найден: {logo_path}")
-            raise FileNotFoundError(f"Файл логотипа не найден: {logo_path}")
-            
-        pixmap = QPixmap(logo_path)
-        if pixmap.isNull():
-            logger.error(f"Не удалось загрузить логотип: {logo_path}")
-            raise ValueError(f"Не удалось загрузить логотип: {logo_path}")
-            
-        scaled_pixmap = pixmap.scaled(logo_size, logo_size, Qt.KeepAspectRatio,
-                                    Qt.SmoothTransformation)
-        self.logo_label.setPixmap(scaled_pixmap)
-        
-        # Увеличиваем размер окна, чтобы логотип не обрезался
-        padding = 40
-        self.setFixedSize(logo_size + padding * 2, logo_size + padding * 2)
-        
-        # Настройка анимации
-        self.animation = QPropertyAnimation(self, b"windowOpacity")
-        self.animation.setDuration(2500)
-        self.animation.setStartValue(0.0)
-        self.animation.setEndValue(1.0)
-        self.animation.setEasingCurve(QEasingCurve.InOutQuad)
-        
-        # Таймер для закрытия сплэша
-        self.close_timer = QTimer()
-        self.close_timer.setSingleShot(True)
-        self.close_timer.timeout.connect(self.close)
-        self.close_timer.start(duration)
-        logger.info("Сплэш-скрин инициализирован")
-        
-    def showEvent(self, event):
-        # Центрируем окно на экране
-        screen = QApplication.primaryScreen()
-        screen_geometry = screen.geometry()
-        x = (screen_geometry.width() - self.width()) // 2
-        y = (screen_geometry.height() - self.height()) // 2
-        self.move(x, y)
-        super().showEvent(event)
-        self.animation.start()
-        logger.info("Сплэш-скрин показан")
+from protocol import ProtocolClient, ProtocolError, negotiate
+from path_cache import PathCache
+from ipc import ipc_address, session_id
 
 class EKillerClient:
-    def __init__(self, config_path, process_path=None):
+    def __init__(self, config_path, process_path=None, companions=None):
         logger.info(f"Инициализация клиента с конфигурацией: {config_path}")
         if not os.path.exists(config_path):
             logger.error(f"Файл конфигурации не найден: {config_path}")
             raise FileNotFoundError(f"Файл конфигурации не найден: {config_path}")
         self.config = self.load_config(config_path)
         self.setup_logging()
+        self.path_cache = PathCache(self.path_cache_file())
         self.socket = None
+        self.channel = None
         self.connected = False
         # Если путь передан — имя процесса берём из basename
         if process_path:
@@ -90,6 +36,8 @@ class EKillerClient:
         else:
             self.process_path = self.config['Process']['defaultpath']
             self.process_name = os.path.basename(self.process_path)
+        # Процессы, которые завершаются вместе с основным (--with)
+        self.companions = list(companions or [])
         logger.info(f"Клиент инициализирован, процесс для завершения: {self.process_name}, путь: {self.process_path}")
         
     def load_config(self, config_path):
@@ -114,11 +62,19 @@ class EKillerClient:
                 rotation=self.config['Logging']['rotation'],
                 retention=self.config['Logging']['retention']
             )
+            self.log_path = log_path
             logger.info(f"Логирование настроено: {log_path}")
         except Exception as e:
             logger.error(f"Ошибка при настройке логирования: {e}")
             raise
             
+    def path_cache_file(self):
+        """Файл кэша путей к программам: [Process] path_cache или рядом с журналом"""
+        path = self.config.get('Process', 'path_cache', fallback='')
+        if path:
+            return os.path.expandvars(path).replace('/', os.path.sep)
+        return os.path.join(os.path.dirname(self.log_path), 'paths.json')
+
     def connect_to_server(self):
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -128,67 +84,258 @@ class EKillerClient:
             self.socket.connect((host, port))
             self.connected = True
             logger.info("Подключено к серверу")
+            self.negotiate_protocol()
             return True
         except Exception as e:
             self.connected = False
             logger.error(f"Ошибка подключения к серверу: {e}")
             return False
+
+    def negotiate_protocol(self):
+        """Переход на кадровый протокол, если его поддерживает сервер"""
+        mode = self.config.get('Server', 'protocol', fallback='auto').strip().lower()
+        if mode == 'text':
+            return
+        timeout = self.config.getfloat('Server', 'hello_timeout', fallback=1.0)
+        version = negotiate(self.socket, timeout)
+        if version is None:
+            if mode == 'framed':
+                raise ProtocolError("Сервер не поддерживает кадровый протокол")
+            logger.info("Сервер не ответил на приветствие, используется текстовый протокол")
+            return
+        self.channel = ProtocolClient(self.socket)
+        logger.info(f"Используется кадровый протокол v{version}")
+
+    def companions_for(self, process_name, companions=None):
+        """Сопутствующие процессы: из [Companions] для process_name и переданные явно"""
+        value = self.config.get('Companions', process_name, fallback='')
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        names += companions if companions is not None else self.companions
+        return [name for name in dict.fromkeys(names) if name.lower() != process_name.lower()]
+
+    def request_kill(self, username, process_name=None, companions=()):
+        """Команда завершения процесса. Возвращает (статус, счётчики, id запроса).
+
+        companions — имена или шаблоны процессов, которые сервер завершает
+        тем же проходом, что и основной процесс.
+        """
+        process_name = process_name or self.process_name
+        if self.channel:
+            message = {'cmd': 'kill', 'user': username, 'name': process_name, 'session': session_id()}
+            if companions:
+                message['names'] = [process_name, *companions]
+            logger.info(f"Отправка команды на сервер: {message}")
+            reply = self.channel.request(message)
+            logger.info(f"Получен ответ от сервера: {reply}")
+            stats = {key: reply[key] for key in ('killed', 'gone', 'alive', 'retry_after', 'results') if key in reply}
+            return reply.get('status'), stats, reply.get('id')
+        # Формируем команду с именем пользователя
+        command = f"{username}_kill:{'|'.join([process_name, *companions])}"
+        logger.info(f"Отправка команды на сервер: {command}")
+        self.socket.send(command.encode('utf-8'))
+        # Ожидание ответа от сервера
+        logger.info("Ожидание ответа от сервера")
+        response = self.socket.recv(1024).decode('utf-8')
+        logger.info(f"Получен ответ от сервера: {response}")
+        status, stats = parse_kill_reply(response)
+        return status, stats, None
+
+    def request_kill_with_retry(self, username, process_name=None, companions=()):
+        """request_kill с повтором, пока сервер отвечает busy"""
+        retries = self.config.getint('Server', 'busy_retries', fallback=5)
+        max_delay = self.config.getfloat('Server', 'busy_max_delay', fallback=30.0)
+        attempt = 0
+        while True:
+            status, stats, request_id = self.request_kill(username, process_name, companions)
+            if status != "busy" or attempt >= retries:
+                return status, stats, request_id
+            delay = busy_delay(stats.get('retry_after', 1.0), attempt, max_delay)
+            logger.warning(f"Сервер занят, повтор через {delay:.1f} с (попытка {attempt + 1} из {retries})")
+            time.sleep(delay)
+            attempt += 1
+
+    def confirm_start(self, request_id=None):
+        """Подтверждение запуска приложения серверу"""
+        if self.channel:
+            self.channel.send({'cmd': 'taskstart-ok', 'id': request_id})
+        else:
+            self.socket.send("taskstart-ok".encode('utf-8'))
+        logger.info("Отправлено подтверждение запуска")
+
+    def launch_process(self, process_path=None):
+        """Запуск программы по пути из аргумента или настроек"""
+        process_path = (process_path or self.process_path).replace('/', os.path.sep)
+        process_name = os.path.basename(process_path)
+        if os.path.exists(process_path):
+            logger.info(f"Запуск программы по указанному пути: {process_path}")
+            return subprocess.Popen([process_path])
+        logger.warning(f"Указанный путь не существует: {process_path}")
+        cached_path = self.path_cache.get(process_name)
+        if cached_path:
+            logger.info(f"Путь к программе взят из кэша: {cached_path}")
+            return subprocess.Popen([cached_path])
+        # Пробуем найти программу в системе; exe читается только у процессов с нужным именем
+        found_path = None
+        for proc in psutil.process_iter(['pid', 'name']):
+            if (proc.info['name'] or '').lower() != process_name.lower():
+                continue
+            try:
+                found_path = proc.exe()
+            except psutil.Error:
+                continue
+            if found_path:
+                break
+        if found_path:
+            logger.info(f"Найден путь к программе: {found_path}")
+            return subprocess.Popen([found_path])
+        logger.warning(f"Путь к программе не найден, пробуем запустить по имени: {process_name}")
+        return subprocess.Popen([process_name])
             
-    def kill_process(self):
+    def wait_until_ready(self, proc):
+        """Ожидание готовности запущенной программы.
+
+        Программа считается запущенной, когда она начала обрабатывать ввод
+        (WaitForInputIdle, только Windows) или проработала startup_probe
+        секунд. restart_delay — верхняя граница ожидания.
+        """
+        delay = float(self.config['Process']['restart_delay'])
+        probe = min(self.config.getfloat('Process', 'startup_probe', fallback=1.0), delay)
+        started = time.monotonic()
+        if sys.platform == 'win32':
+            result = ctypes.windll.user32.WaitForInputIdle(int(proc._handle), int(delay * 1000))
+            if result == 0 and proc.poll() is None:
+                logger.info(f"Программа готова к вводу через {time.monotonic() - started:.2f} с")
+                return True
+        while True:
+            code = proc.poll()
+            if code is not None:
+                # Лаунчеры часто запускают основной процесс и сразу выходят
+                logger.warning(f"Запущенный процесс завершился с кодом {code}")
+                return code == 0
+            elapsed = time.monotonic() - started
+            if elapsed >= probe:
+                logger.info(f"Программа работает {elapsed:.2f} с, запуск подтверждён")
+                return True
+            time.sleep(0.05)
+
+    def remember_path(self, process_name, proc):
+        """Сохранение в кэш пути, по которому программа успешно запустилась"""
+        exe_path = proc.args[0]
+        if not os.path.isabs(exe_path):
+            # Запуск по имени: путь знает только сам процесс
+            try:
+                exe_path = psutil.Process(proc.pid).exe()
+            except psutil.Error:
+                return
+        if os.path.isfile(exe_path):
+            self.path_cache.put(process_name, exe_path)
+
+    def kill_process(self, process_path=None, companions=None):
         if not self.connected:
             logger.error("Нет подключения к серверу")
             return False
+        process_path = process_path or self.process_path
+        process_name = os.path.basename(process_path)
         try:
             # Получаем имя пользователя Windows
-            username = os.getlogin()
-            # Формируем команду с именем пользователя
-            command = f"{username}_kill:{self.process_name}"
-            logger.info(f"Отправка команды на сервер: {command}")
-            self.socket.send(command.encode('utf-8'))
-            # Ожидание ответа от сервера
-            logger.info("Ожидание ответа от сервера")
-            response = self.socket.recv(1024).decode('utf-8')
-            logger.info(f"Получен ответ от сервера: {response}")
-            if response == "ok-taskkill":
-                # Получаем путь к программе из аргумента или настроек
-                process_path = self.process_path.replace('/', os.path.sep)
-                if os.path.exists(process_path):
-                    logger.info(f"Запуск программы по указанному пути: {process_path}")
-                    subprocess.Popen([process_path])
-                else:
-                    logger.warning(f"Указанный путь не существует: {process_path}")
-                    # Пробуем найти программу в системе
-                    found_path = None
-                    for proc in psutil.process_iter(['pid', 'name', 'exe']):
-                        if proc.info['name'].lower() == self.process_name.lower():
-                            found_path = proc.info['exe']
-                            break
-                    if found_path:
-                        logger.info(f"Найден путь к программе: {found_path}")
-                        subprocess.Popen([found_path])
-                    else:
-                        logger.warning(f"Путь к программе не найден, пробуем запустить по имени: {self.process_name}")
-                        subprocess.Popen([self.process_name])
-                # Ожидание указанной задержки
-                delay = int(self.config['Process']['restart_delay'])
-                logger.info(f"Ожидание {delay} секунд перед отправкой подтверждения")
-                time.sleep(delay)
+            username = get_username()
+            companions = self.companions_for(process_name, companions)
+            status, stats, request_id = self.request_kill_with_retry(username, process_name, companions)
+            if status == "ok-taskkill":
+                if stats:
+                    logger.info(
+                        f"Сервер завершил процессов: {stats.get('killed', 0)}, "
+                        f"подтверждено: {stats.get('gone', 0)}, живы: {stats.get('alive', 0)}"
+                    )
+                for name, counts in stats.get('results', {}).items():
+                    logger.info(
+                        f"{name}: завершено {counts['killed']}, подтверждено {counts['gone']}, "
+                        f"живы {counts['alive']}"
+                    )
+                if stats.get('alive'):
+                    logger.warning("Не все экземпляры завершились, запуск может столкнуться с блокировкой файлов")
+                proc = self.launch_process(process_path)
+                # Подтверждаем, как только программа запустилась
+                if self.wait_until_ready(proc):
+                    self.remember_path(process_name, proc)
                 # Отправка подтверждения
-                self.socket.send("taskstart-ok".encode('utf-8'))
-                logger.info("Отправлено подтверждение запуска")
+                self.confirm_start(request_id)
                 return True
             else:
-                logger.error(f"Неожиданный ответ от сервера: {response}")
+                logger.error(f"Неожиданный ответ от сервера: {status}")
                 return False
         except Exception as e:
             logger.error(f"Ошибка при выполнении команды: {e}")
             return False
             
+    def request_via_agent(self):
+        """Передача команды агенту сеанса (agent.py) через локальный IPC.
+
+        Возвращает False, если агент выключен в настройках или недоступен —
+        тогда клиент работает с сервером напрямую.
+        """
+        if not self.config.getboolean('Agent', 'enabled', fallback=False):
+            return False
+        try:
+            with open(agent_key_path(self.config), 'rb') as f:
+                authkey = f.read()
+            conn = Client(agent_address(get_username(), session_id()), authkey=authkey)
+        except Exception as e:
+            logger.info(f"Агент сеанса недоступен, работаем напрямую: {e}")
+            return False
+        try:
+            logger.info(f"Передача команды агенту сеанса: {self.process_path}")
+            conn.send({'path': self.process_path, 'companions': self.companions})
+            timeout = self.config.getfloat('Agent', 'timeout', fallback=60.0)
+            if not conn.poll(timeout):
+                logger.error(f"Агент не ответил за {timeout} с")
+            else:
+                reply = conn.recv()
+                logger.info(f"Ответ агента: {reply}")
+            return True
+        finally:
+            conn.close()
+
     def close(self):
-        if self.socket:
+        if self.channel:
+            logger.info("Закрытие соединения с сервером")
+            self.channel.close()
+        elif self.socket:
             logger.info("Закрытие соединения с сервером")
             self.socket.close()
 
+def parse_kill_reply(response):
+    """Разбор ответа ok-taskkill[:killed=N;gone=N;alive=N[;имя=K/G/A...]] или busy:retry_after=N"""
+    status, _, details = response.partition(':')
+    stats = {}
+    for part in details.split(';'):
+        key, sep, value = part.partition('=')
+        if not sep:
+            continue
+        if '/' in value:
+            # Счётчики отдельной цели многоцелевой команды
+            try:
+                killed, gone, alive = (int(number) for number in value.split('/'))
+            except ValueError:
+                continue
+            stats.setdefault('results', {})[key.strip()] = {'killed': killed, 'gone': gone, 'alive': alive}
+            continue
+        try:
+            number = float(value)
+        except ValueError:
+            continue
+        stats[key.strip()] = int(number) if number.is_integer() else number
+    return status, stats
+
+def busy_delay(retry_after, attempt, max_delay=30.0):
+    """Пауза перед повтором после busy: retry_after плюс случайная добавка.
+
+    Добавка растёт с каждой попыткой, чтобы клиенты, получившие отказ
+    одновременно, не вернулись к серверу тоже одновременно.
+    """
+    spread = retry_after * (2 ** attempt)
+    return min(max_delay, retry_after + random.uniform(0, spread))
+
 def kill_parent():
     try:
         ppid = os.getppid()
@@ -197,36 +344,79 @@ def kill_parent():
     except Exception as e:
         pass
 
+def get_username():
+    """Имя пользователя Windows (os.getlogin недоступен без консоли)"""
+    try:
+        return os.getlogin()
+    except OSError:
+        return getpass.getuser()
+
+def agent_address(username, session_id=None):
+    """Адрес локального IPC агента: именованный канал или unix-сокет"""
+    name = f"ekiller-agent-{username}"
+    if session_id is not None:
+        name += f"-{session_id}"
+    return ipc_address(name)
+
+def agent_key_path(config):
+    """Файл с ключом агента, доступный только владельцу профиля"""
+    key_path = config.get('Agent', 'key_path', fallback='${USERPROFILE}/ekiller/agent.key')
+    return os.path.expandvars(key_path).replace('/', os.path.sep)
+
+def run_client(client):
+    """Подключение к серверу, завершение и перезапуск программы"""
+    logger.info("Начало выполнения основной логики")
+    if client.request_via_agent():
+        return
+    if client.connect_to_server():
+        client.kill_process()
+    # Закрываем клиент
+    client.close()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="client.py", description="Клиент EKiller")
+    parser.add_argument('process_path', nargs='?', help="путь до программы")
+    parser.add_argument('--headless', action='store_true',
+                        help="без сплэш-скрина и без загрузки Qt")
+    parser.add_argument('--with', dest='companions', action='append', default=[], metavar='ИМЯ',
+                        help="ещё один процесс (имя или шаблон) для завершения вместе с программой")
+    return parser.parse_args(argv)
+
+def show_splash_while(client, worker):
+    """Показ сплэш-скрина, пока в фоне идёт обмен с сервером"""
+    # Qt загружается только в режиме со сплэш-скрином
+    from PySide6.QtWidgets import QApplication
+    from splash import SplashScreen
+    app = QApplication(sys.argv)
+    splash = SplashScreen(
+        logo_path=client.config['Splash']['logo_path'],
+        logo_size=int(client.config['Splash']['logo_size']),
+        duration=int(client.config['Splash']['duration'])
+    )
+    splash.show()
+    # exec() возвращает управление, когда сплэш-скрин закрылся
+    logger.info("Ожидание завершения сплэш-скрина")
+    app.exec()
+    worker.join()
+
 def main():
     try:
         logger.info("Запуск клиента")
-        app = QApplication(sys.argv)
-        process_path = None
-        if len(sys.argv) == 2:
-            process_path = sys.argv[1]
+        args = parse_args(sys.argv[1:])
+        process_path = args.process_path
+        if process_path:
             logger.info(f"Получен аргумент: путь={process_path}")
-        elif len(sys.argv) != 1:
-            print("Использование: python client.py [<путь_до_программы>]")
-            sys.exit(1)
         # Используем новый файл настроек
-        client = EKillerClient('settings.inf', process_path=process_path)
-        # Создаем и показываем сплэш-скрин
-        splash = SplashScreen(
-            logo_path=client.config['Splash']['logo_path'],
-            logo_size=int(client.config['Splash']['logo_size']),
-            duration=int(client.config['Splash']['duration'])
-        )
-        splash.show()
-        # Ждем завершения сплэш-скрина
-        logger.info("Ожидание завершения сплэш-скрина")
-        while splash.isVisible():
-            app.processEvents()
-        # Подключаемся к серверу и выполняем команду
-        logger.info("Начало выполнения основной логики")
-        if client.connect_to_server():
-            client.kill_process()
-        # Закрываем клиент
-        client.close()
+        client = EKillerClient('settings.inf', process_path=process_path, companions=args.companions)
+        headless = args.headless or not client.config.getboolean('Splash', 'enabled', fallback=True)
+        if headless:
+            logger.info("Запуск без сплэш-скрина")
+            run_client(client)
+        else:
+            # Обмен с сервером идёт параллельно с показом сплэш-скрина
+            worker = threading.Thread(target=run_client, args=(client,))
+            worker.start()
+            show_splash_while(client, worker)
         # Завершаем приложение
         logger.info("Завершение работы клиента")
         kill_parent()
@@ -236,4 +426,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
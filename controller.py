@@ -0,0 +1,205 @@
+"""Завершение процесса сразу на многих серверах EKiller.
+
+    python controller.py excel.exe ts01 ts02 ts03:5001
+    python controller.py excel.exe --hosts-file farm.txt --parallel 32 --timeout 15
+
+Ко всем серверам подключается одновременно (не больше --parallel
+подключений), на каждый отводится не больше --timeout секунд. Недоступный
+или зависший сервер не задерживает остальные; в конце печатается
+таблица результатов по каждому хосту.
+"""
+import argparse
+import configparser
+import json
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from loguru import logger
+from client import get_username, parse_kill_reply
+from protocol import ProtocolClient, ProtocolError, negotiate
+
+
+class HostResult:
+    """Итог команды на одном сервере"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        # ok, busy, error или timeout
+        self.status = None
+        self.killed = None
+        self.gone = None
+        self.alive = None
+        self.retry_after = None
+        self.error = None
+        self.seconds = None
+
+    def as_dict(self):
+        return {
+            'host': self.host,
+            'port': self.port,
+            'status': self.status,
+            'killed': self.killed,
+            'gone': self.gone,
+            'alive': self.alive,
+            'retry_after': self.retry_after,
+            'error': self.error,
+            'seconds': self.seconds,
+        }
+
+
+class FarmController:
+    """Рассылка команды kill по списку серверов с ограничением параллельности"""
+
+    def __init__(self, username, parallel=16, timeout=15.0, hello_timeout=1.0, protocol='auto'):
+        self.username = username
+        self.parallel = parallel
+        self.timeout = timeout
+        self.hello_timeout = hello_timeout
+        self.protocol = protocol
+
+    def kill_everywhere(self, process_name, hosts):
+        """Результаты в порядке списка hosts"""
+        with ThreadPoolExecutor(max_workers=max(1, min(self.parallel, len(hosts)))) as pool:
+            futures = [pool.submit(self.kill_on_host, host, port, process_name) for host, port in hosts]
+            return [future.result() for future in futures]
+
+    def kill_on_host(self, host, port, process_name):
+        result = HostResult(host, port)
+        started = time.monotonic()
+        deadline = started + self.timeout
+        sock = None
+        channel = None
+        try:
+            sock = socket.create_connection((host, port), timeout=self.timeout)
+            if self.protocol != 'text':
+                version = negotiate(sock, min(self.hello_timeout, remaining(deadline)))
+                if version is not None:
+                    channel = ProtocolClient(sock)
+                elif self.protocol == 'framed':
+                    raise ProtocolError("Сервер не поддерживает кадровый протокол")
+            if channel:
+                reply = channel.request(
+                    {'cmd': 'kill', 'user': self.username, 'name': process_name},
+                    timeout=remaining(deadline)
+                )
+                status, stats = reply.get('status'), reply
+            else:
+                sock.settimeout(remaining(deadline))
+                sock.send(f"{self.username}_kill:{process_name}".encode('utf-8'))
+                status, stats = parse_kill_reply(sock.recv(1024).decode('utf-8'))
+            if status == 'ok-taskkill':
+                result.status = 'ok'
+                result.killed = stats.get('killed')
+                result.gone = stats.get('gone')
+                result.alive = stats.get('alive')
+                # Программа не перезапускается: сразу отпускаем команду на сервере
+                if channel:
+                    channel.send({'cmd': 'taskstart-ok', 'id': reply.get('id')})
+                else:
+                    sock.send(b"taskstart-ok")
+            elif status == 'busy':
+                result.status = 'busy'
+                result.retry_after = stats.get('retry_after')
+            else:
+                result.status = 'error'
+                result.error = f"Неожиданный ответ: {status}"
+        except (socket.timeout, TimeoutError, FutureTimeoutError):
+            # channel.request бросает concurrent.futures.TimeoutError, до Python 3.11 это другой класс
+            result.status = 'timeout'
+            result.error = f"Нет ответа за {self.timeout} с"
+        except Exception as e:
+            result.status = 'error'
+            result.error = str(e) or type(e).__name__
+        finally:
+            if channel:
+                channel.close()
+            elif sock:
+                sock.close()
+        result.seconds = round(time.monotonic() - started, 3)
+        if result.status != 'ok':
+            logger.warning(f"{host}:{port}: {result.status} {result.error or ''}".rstrip())
+        return result
+
+
+def remaining(deadline):
+    """Остаток времени до deadline; TimeoutError, если время вышло"""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError
+    return left
+
+
+def parse_host(value, default_port):
+    """host или host:port"""
+    host, sep, port = value.strip().rpartition(':')
+    if not sep:
+        return value.strip(), default_port
+    return host, int(port)
+
+
+def read_hosts(args, default_port):
+    values = list(args.hosts)
+    if args.hosts_file:
+        with open(args.hosts_file, encoding='utf-8') as f:
+            values.extend(line.split('#')[0] for line in f)
+    return [parse_host(value, default_port) for value in values if value.strip()]
+
+
+def format_table(results):
+    headers = ('host', 'status', 'killed', 'gone', 'alive', 'seconds', 'error')
+    rows = [[
+        f"{r.host}:{r.port}", r.status,
+        *('' if value is None else str(value) for value in (r.killed, r.gone, r.alive, r.seconds)),
+        r.error or (f"retry_after={r.retry_after}" if r.retry_after is not None else ''),
+    ] for r in results]
+    widths = [max(len(headers[i]), *(len(row[i]) for row in rows)) for i in range(len(headers))]
+    lines = ['  '.join(h.ljust(w) for h, w in zip(headers, widths))]
+    lines.extend('  '.join(cell.ljust(w) for cell, w in zip(row, widths)) for row in rows)
+    return '\n'.join(line.rstrip() for line in lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="controller.py", description="Завершение процесса на многих серверах EKiller")
+    parser.add_argument('process_name', help="имя процесса, например excel.exe")
+    parser.add_argument('hosts', nargs='*', help="серверы в виде host или host:port")
+    parser.add_argument('--hosts-file', help="файл со списком серверов, по одному в строке")
+    parser.add_argument('--config', default='settings.inf', help="порт и протокол по умолчанию берутся из [Server]")
+    parser.add_argument('--user', help="имя пользователя в команде (по умолчанию текущий)")
+    parser.add_argument('--parallel', type=int, default=16, help="одновременных подключений")
+    parser.add_argument('--timeout', type=float, default=15.0, help="предельное время на один сервер, с")
+    parser.add_argument('--json', action='store_true', help="вывести результаты в JSON")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    hosts = read_hosts(args, config.getint('Server', 'port', fallback=5000))
+    if not hosts:
+        logger.error("Не указан ни один сервер")
+        sys.exit(2)
+    controller = FarmController(
+        args.user or get_username(),
+        parallel=args.parallel,
+        timeout=args.timeout,
+        hello_timeout=config.getfloat('Server', 'hello_timeout', fallback=1.0),
+        protocol=config.get('Server', 'protocol', fallback='auto').strip().lower()
+    )
+    logger.info(f"Завершение {args.process_name} на {len(hosts)} серверах")
+    results = controller.kill_everywhere(args.process_name, hosts)
+    if args.json:
+        print(json.dumps([result.as_dict() for result in results], ensure_ascii=False, indent=2))
+    else:
+        print(format_table(results))
+    failed = sum(result.status != 'ok' for result in results)
+    if failed:
+        logger.warning(f"Не удалось на {failed} из {len(results)} серверов")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
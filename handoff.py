@@ -0,0 +1,109 @@
+"""Передача работающего сервера новому экземпляру без простоя.
+
+Работающий сервер слушает локальный IPC (именованный канал или
+unix-сокет). Новый экземпляр при запуске подключается к нему и получает
+копию слушающего TCP-сокета. Сокет всё это время остаётся открытым, и
+подключения клиентов копятся в его очереди, поэтому отказов в момент
+обновления нет. Старый экземпляр перестаёт принимать подключения,
+доводит до конца уже принятые команды и сообщает об этом новому. До
+этого момента новый экземпляр не начинает выполнение своих команд.
+"""
+import os
+import socket
+import sys
+import threading
+from multiprocessing import reduction
+from multiprocessing.connection import AuthenticationError, Client
+from loguru import logger
+from ipc import ipc_address, listen, write_key
+
+
+def handoff_address(port):
+    """Адрес канала передачи сервера, слушающего port"""
+    return ipc_address(f"ekiller-server-{port}")
+
+
+def send_socket(conn, sock, pid):
+    """Передача копии сокета процессу pid"""
+    if sys.platform == 'win32':
+        conn.send(sock.share(pid))
+    else:
+        reduction.send_handle(conn, sock.fileno(), pid)
+
+
+def recv_socket(conn):
+    if sys.platform == 'win32':
+        return socket.fromshare(conn.recv())
+    return socket.socket(fileno=reduction.recv_handle(conn))
+
+
+def request_takeover(address, key_path, timeout=10.0):
+    """Получение слушающего сокета от работающего экземпляра.
+
+    Возвращает (канал, сокет) или None, если работающего экземпляра нет
+    или он отказал в передаче.
+    """
+    try:
+        with open(key_path, 'rb') as f:
+            authkey = f.read()
+        conn = Client(address, authkey=authkey)
+    except (OSError, EOFError, AuthenticationError) as e:
+        logger.debug(f"Работающий экземпляр сервера не найден: {e}")
+        return None
+    try:
+        conn.send({'cmd': 'takeover', 'pid': os.getpid()})
+        if not conn.poll(timeout):
+            raise TimeoutError(f"нет ответа за {timeout} с")
+        reply = conn.recv()
+        if reply.get('status') != 'ok':
+            raise ConnectionError(reply.get('error', reply))
+        return conn, recv_socket(conn)
+    except Exception as e:
+        logger.warning(f"Работающий экземпляр не передал сокет: {e}")
+        conn.close()
+        return None
+
+
+class HandoffListener:
+    """Канал, через который новый экземпляр забирает сервер.
+
+    on_takeover(канал, pid) вызывается в потоке канала и возвращает
+    False, если передача не удалась и сервер продолжает работу.
+    """
+
+    def __init__(self, address, key_path, on_takeover):
+        self.address = address
+        self.key_path = key_path
+        self.on_takeover = on_takeover
+        self.listener = None
+
+    def start(self):
+        # Новый ключ канала для каждого запуска сервера
+        self.listener = listen(self.address, write_key(self.key_path))
+        thread = threading.Thread(target=self.serve, args=(self.listener,), name='ekiller-handoff')
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Канал передачи сервера: {self.address}")
+
+    def serve(self, listener):
+        while self.listener is listener:
+            try:
+                conn = listener.accept()
+                message = conn.recv()
+            except Exception as e:
+                if self.listener is listener:
+                    logger.warning(f"Отклонён запрос на передачу сервера: {e}")
+                continue
+            if message.get('cmd') != 'takeover':
+                conn.close()
+                continue
+            # Сервер передаётся только один раз: канал освобождается для нового экземпляра
+            self.close()
+            if not self.on_takeover(conn, message.get('pid')):
+                self.start()
+            return
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener:
+            listener.close()
@@ -0,0 +1,344 @@
+"""Распаковка zip-архивов установщика по мере загрузки.
+
+Оглавление архива (central directory) читается по HTTP Range с конца
+файла. Затем элементы скачиваются Range-запросами и распаковываются на
+лету в несколько потоков, без промежуточного zip на диске. Элементы,
+которые уже установлены с тем же размером и CRC-32, не скачиваются: при
+переустановке приходят только изменившиеся файлы. Абсолютные пути и
+пути с «..» отклоняются.
+
+Если сервер не поддерживает Range или архив сжат неподдерживаемым
+методом, вызывающий код скачивает архив целиком и распаковывает его
+через extract_local — тоже параллельно и с пропуском неизменённых файлов.
+"""
+import io
+import logging
+import os
+import shutil
+import struct
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+CHUNK_SIZE = 64 * 1024
+# Подряд идущие элементы (до этого объёма и числа) скачиваются одним запросом;
+# ограничение числа распределяет мелкие файлы по потокам
+BATCH_SIZE = 1024 * 1024
+BATCH_FILES = 256
+# Запись конца архива (22 байта) с комментарием до 64 КБ
+TAIL_SIZE = 64 * 1024 + 22
+END_SIGNATURE = b'PK\x05\x06'
+LOCAL_SIGNATURE = b'PK\x03\x04'
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+STREAMED_METHODS = (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveError(Exception):
+    """Архив повреждён или содержит недопустимые пути"""
+
+
+class ArchiveUnsupported(Exception):
+    """Потоковая распаковка невозможна, нужно скачать архив целиком"""
+
+
+def member_path(root, name):
+    """Путь элемента архива внутри root; ArchiveError при выходе за root"""
+    normalized = os.path.normpath(name.replace('\\', '/'))
+    if (os.path.isabs(normalized) or os.path.splitdrive(normalized)[0]
+            or normalized == '..' or normalized.startswith('..' + os.sep)):
+        raise ArchiveError(f"Недопустимый путь в архиве: {name}")
+    return os.path.join(root, normalized)
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def unchanged(info, installed):
+    """Файл элемента уже лежит в папке installed с тем же содержимым"""
+    if not installed:
+        return False
+    path = member_path(installed, info.filename)
+    try:
+        return os.path.getsize(path) == info.file_size and file_crc32(path) == info.CRC
+    except OSError:
+        return False
+
+
+def plan_members(infos, dest, installed, pool):
+    """Файлы, которые нужно распаковать, и число пропущенных; папки создаются сразу"""
+    files = []
+    for info in infos:
+        path = member_path(dest, info.filename)
+        if info.is_dir():
+            os.makedirs(path, exist_ok=True)
+        elif info.flag_bits & 0x1:
+            raise ArchiveError(f"Зашифрованный элемент архива: {info.filename}")
+        else:
+            files.append(info)
+    same = list(pool.map(lambda info: unchanged(info, installed), files))
+    return [info for info, skip in zip(files, same) if not skip], same.count(True)
+
+
+class _Progress:
+    """Общий счётчик полученных байт для потоков распаковки"""
+
+    def __init__(self, total, callback):
+        self.total = total
+        self.callback = callback
+        self.received = 0
+        self.lock = threading.Lock()
+
+    def add(self, size):
+        # Под блокировкой, чтобы обновления из потоков не перемешивались;
+        # отрицательный size — откат байт оборванной попытки
+        with self.lock:
+            self.received += size
+            if self.callback:
+                self.callback(self.received, self.total)
+
+
+class _TailFile(io.RawIOBase):
+    """Конец файла размером size: через него zipfile читает оглавление"""
+
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size
+        self.start = size - len(data)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = offset
+        return offset
+
+    def tell(self):
+        return self.position
+
+    def read(self, size=-1):
+        if self.position < self.start:
+            raise ArchiveUnsupported("Оглавление архива не поместилось в прочитанный конец файла")
+        begin = self.position - self.start
+        data = self.data[begin:] if size is None or size < 0 else self.data[begin:begin + size]
+        self.position += len(data)
+        return data
+
+
+class _RangeStream:
+    """Последовательное чтение ответа на Range-запрос"""
+
+    def __init__(self, resp, position):
+        self.chunks = resp.iter_content(CHUNK_SIZE)
+        self.buffer = b''
+        # Прочитанная часть буфера: мелкие чтения не копируют его остаток
+        self.offset = 0
+        self.position = position
+
+    def read(self, size):
+        """Ровно size байт; меньше — только если ответ закончился"""
+        while len(self.buffer) - self.offset < size:
+            chunk = next(self.chunks, None)
+            if not chunk:
+                break
+            self.buffer = self.buffer[self.offset:] + chunk
+            self.offset = 0
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += len(data)
+        self.position += len(data)
+        return data
+
+    def read_exact(self, size, name):
+        data = self.read(size)
+        if len(data) != size:
+            raise ArchiveError(f"Архив оборвался на элементе {name}")
+        return data
+
+
+def remote_size(url, session):
+    resp = session.head(url, timeout=30, allow_redirects=True)
+    if resp.status_code != 200 or not resp.headers.get('Content-Length'):
+        raise ArchiveUnsupported(f"Размер архива неизвестен: {resp.status_code} {resp.reason}")
+    return int(resp.headers['Content-Length'])
+
+
+def fetch_tail(url, session, start, size):
+    """Байты файла с start до конца (size — полный размер файла)"""
+    resp = session.get(url, headers={'Range': f"bytes={start}-{size - 1}"}, stream=True, timeout=30)
+    if resp.status_code != 206:
+        # Без Range сервер отдал бы весь архив: не читаем тело
+        resp.close()
+        raise ArchiveUnsupported(f"Сервер не поддерживает Range: {resp.status_code} {resp.reason}")
+    return resp.content
+
+
+def open_index(tail, size):
+    with zipfile.ZipFile(_TailFile(tail, size)) as archive:
+        infos = sorted(archive.infolist(), key=lambda info: info.header_offset)
+        return infos, archive.start_dir
+
+
+def read_index(url, session):
+    """Элементы архива по возрастанию смещения и начало оглавления"""
+    size = remote_size(url, session)
+    tail = fetch_tail(url, session, max(0, size - TAIL_SIZE), size)
+    try:
+        return open_index(tail, size)
+    except ArchiveUnsupported:
+        # Оглавление больше прочитанного конца: дочитываем его по смещению из записи конца архива
+        end = tail.rfind(END_SIGNATURE)
+        if end < 0:
+            raise zipfile.BadZipFile("Не найдена запись конца архива")
+        directory = struct.unpack('<L', tail[end + 16:end + 20])[0]
+        if directory == 0xFFFFFFFF:
+            raise
+        return open_index(fetch_tail(url, session, directory, size), size)
+
+
+def group_batches(infos, bounds):
+    """Подряд идущие элементы, которые скачиваются одним запросом: [начало, конец, элементы]"""
+    batches = []
+    for info in infos:
+        start = info.header_offset
+        end = bounds[start]
+        if (batches and batches[-1][1] == start and end - batches[-1][0] <= BATCH_SIZE
+                and len(batches[-1][2]) < BATCH_FILES):
+            batches[-1][1] = end
+            batches[-1][2].append(info)
+        else:
+            batches.append([start, end, [info]])
+    return batches
+
+
+def extract_member(stream, info, dest, progress):
+    """Распаковка элемента, локальный заголовок которого — следующие байты потока"""
+    header = stream.read_exact(LOCAL_HEADER.size, info.filename)
+    fields = LOCAL_HEADER.unpack(header)
+    if fields[0] != LOCAL_SIGNATURE:
+        raise ArchiveError(f"Повреждён заголовок элемента {info.filename}")
+    stream.read_exact(fields[-2] + fields[-1], info.filename)
+    decompressor = zlib.decompressobj(-15) if info.compress_type == zipfile.ZIP_DEFLATED else None
+    path = member_path(dest, info.filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    crc = 0
+    remaining = info.compress_size
+    with open(path, 'wb') as f:
+        while remaining:
+            data = stream.read_exact(min(remaining, CHUNK_SIZE), info.filename)
+            remaining -= len(data)
+            progress(len(data))
+            if decompressor:
+                data = decompressor.decompress(data)
+            crc = zlib.crc32(data, crc)
+            f.write(data)
+        if decompressor:
+            data = decompressor.flush()
+            crc = zlib.crc32(data, crc)
+            f.write(data)
+    if crc != info.CRC:
+        os.remove(path)
+        raise ArchiveError(f"CRC элемента {info.filename} не совпал")
+
+
+def fetch_batch(url, session, batch, dest, progress, retries=2):
+    """Скачивание и распаковка группы элементов; при обрыве группа скачивается заново"""
+    for attempt in range(retries + 1):
+        counted = 0
+
+        def count(size):
+            nonlocal counted
+            counted += size
+            progress(size)
+
+        try:
+            return read_batch(url, session, batch, dest, count)
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            # Группа скачивается заново целиком: байты попытки не считаются дважды
+            if counted:
+                progress(-counted)
+            if attempt == retries:
+                raise ArchiveError(f"Не удалось скачать {url}: {e}")
+            logger.info(f"Обрыв загрузки {url} ({e}), повторяю с элемента {batch[2][0].filename}")
+
+
+def read_batch(url, session, batch, dest, progress):
+    start, end, infos = batch
+    resp = session.get(url, headers={'Range': f"bytes={start}-{end - 1}"}, stream=True, timeout=30)
+    with resp:
+        if resp.status_code != 206:
+            raise ArchiveUnsupported(f"Сервер не поддерживает Range: {resp.status_code} {resp.reason}")
+        stream = _RangeStream(resp, start)
+        for info in infos:
+            # Между элементами может быть дескриптор данных
+            stream.read(info.header_offset - stream.position)
+            extract_member(stream, info, dest, progress)
+
+
+def extract_remote(url, dest, installed=None, session=requests, workers=4, progress=None):
+    """Потоковая распаковка архива url в папку dest.
+
+    installed — папка установленной версии: совпадающие с ней файлы не
+    скачиваются. progress(получено, всего) считает сжатые байты.
+    Возвращает (распаковано файлов, пропущено файлов).
+    """
+    infos, directory = read_index(url, session)
+    offsets = [info.header_offset for info in infos]
+    # Данные элемента заканчиваются там, где начинается следующий
+    bounds = dict(zip(offsets, offsets[1:] + [directory]))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        files, skipped = plan_members(infos, dest, installed, pool)
+        for info in files:
+            if info.compress_type not in STREAMED_METHODS:
+                raise ArchiveUnsupported(f"Метод сжатия {info.compress_type} у {info.filename}")
+        counter = _Progress(sum(info.compress_size for info in files), progress)
+        futures = [pool.submit(fetch_batch, url, session, batch, dest, counter.add)
+                   for batch in group_batches(files, bounds)]
+        for future in futures:
+            future.result()
+    logger.info(f"{url}: распаковано файлов {len(files)}, без изменений {skipped}")
+    return len(files), skipped
+
+
+def extract_group(path, infos, dest):
+    # У каждого потока свой дескриптор архива: общий файл читался бы по очереди
+    with zipfile.ZipFile(path) as archive:
+        for info in infos:
+            target = member_path(dest, info.filename)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with archive.open(info) as source, open(target, 'wb') as f:
+                shutil.copyfileobj(source, f, CHUNK_SIZE)
+
+
+def extract_local(path, dest, installed=None, workers=4):
+    """Распаковка скачанного архива path в dest в несколько потоков.
+
+    Возвращает (распаковано файлов, пропущено файлов).
+    """
+    with zipfile.ZipFile(path) as archive:
+        infos = archive.infolist()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        files, skipped = plan_members(infos, dest, installed, pool)
+        futures = [pool.submit(extract_group, path, files[i::workers], dest)
+                   for i in range(workers) if files[i::workers]]
+        for future in futures:
+            future.result()
+    logger.info(f"{os.path.basename(path)}: распаковано файлов {len(files)}, без изменений {skipped}")
+    return len(files), skipped
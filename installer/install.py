@@ -1,21 +1,226 @@
 import sys
 import os
 import requests
-import shutil
 import subprocess
 import json
-from zipfile import BadZipFile
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from PySide6.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QLabel, QCheckBox,
-    QPushButton, QMessageBox, QScrollArea, QGroupBox, QHBoxLayout, QFrame
+    QPushButton, QMessageBox, QScrollArea, QGroupBox, QHBoxLayout, QFrame,
+    QProgressBar, QListWidget
 )
-from PySide6.QtCore import Qt
+from PySide6.QtCore import Qt, QThread, Signal
 from PySide6.QtGui import QPalette, QColor
 from ctypes import windll
-import zipfile
+from zipfile import BadZipFile
+from archive import ArchiveUnsupported, extract_local, extract_remote
+
+# Общий с апдейтером слой загрузки (при сборке exe: pyinstaller --paths updater)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'updater'))
+from downloader import Downloader
 
 UPDATE_SERVER = "http://134.17.25.127:54321"
 CONFIG_URL = f"{UPDATE_SERVER}/installer_config.json"
+# Одновременных загрузок (переопределяется download_workers в installer_config.json)
+DOWNLOAD_WORKERS = 4
+
+
+def pooled_session(workers):
+    """Сессия с пулом соединений на все потоки загрузки"""
+    session = requests.Session()
+    # Архивы распаковываются в своих потоках, параллельно с загрузками файлов
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers * 2)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def staging_dir(install_dir):
+    """Папка рядом с install_dir, куда файлы скачиваются до установки"""
+    return install_dir.rstrip('\\/') + '.staging'
+
+
+def app_downloads(app, staging):
+    """Загрузки приложения: (url, путь в staging, sha256, папка установки для zip).
+
+    Для архивов передаётся install_dir: уже установленные без изменений
+    файлы архива не скачиваются.
+    """
+    jobs = [(f"{UPDATE_SERVER}/{app['exe']}", os.path.join(staging, os.path.basename(app["exe"])),
+             app.get("sha256"), None)]
+    for item in app.get("extra", []):
+        if item.endswith('/'):
+            zip_name = os.path.basename(item.rstrip('/')) + ".zip"
+            zip_url = f"{UPDATE_SERVER}/{os.path.dirname(item.rstrip('/'))}/{zip_name}"
+            jobs.append((zip_url, os.path.join(staging, '_zip', zip_name), None, app["install_dir"]))
+        else:
+            rel_path = os.path.relpath(item, start=os.path.dirname(app["exe"]))
+            jobs.append((f"{UPDATE_SERVER}/{item}", os.path.join(staging, rel_path), None, None))
+    return jobs
+
+
+def commit_staging(staging, install_dir):
+    """Перенос скачанных файлов из staging в install_dir.
+
+    Заменяемые файлы сначала переносятся в резервную папку рядом с
+    install_dir. Если какой-то файл заменить не удалось (например, он
+    занят запущенной программой), уже перенесённые файлы возвращаются на
+    место, и в install_dir остаётся прежняя версия целиком.
+    """
+    backup = install_dir.rstrip('\\/') + '.backup'
+    shutil.rmtree(backup, ignore_errors=True)
+    # (файл в install_dir, его прежняя версия в backup или None)
+    moved = []
+    try:
+        for folder, _, files in os.walk(staging):
+            relative = os.path.relpath(folder, staging)
+            if relative.split(os.sep)[0] == '_zip':
+                # Служебная папка для архивов, распакованных в staging
+                continue
+            target_folder = os.path.join(install_dir, relative)
+            os.makedirs(target_folder, exist_ok=True)
+            for name in files:
+                target = os.path.join(target_folder, name)
+                saved = None
+                if os.path.exists(target):
+                    saved = os.path.join(backup, relative, name)
+                    os.makedirs(os.path.dirname(saved), exist_ok=True)
+                    os.replace(target, saved)
+                moved.append((target, saved))
+                os.replace(os.path.join(folder, name), target)
+    except OSError:
+        rollback_staging(moved)
+        raise
+    shutil.rmtree(staging, ignore_errors=True)
+    # Занятые старые файлы (запущенный exe) удалятся при следующей установке
+    shutil.rmtree(backup, ignore_errors=True)
+
+
+def rollback_staging(moved):
+    """Возврат прежних файлов на место после неудачного commit_staging"""
+    for target, saved in reversed(moved):
+        try:
+            if saved:
+                os.replace(saved, target)
+            elif os.path.exists(target):
+                os.remove(target)
+        except OSError as e:
+            print(f"Не удалось вернуть {target}: {e}")
+
+
+class InstallWorker(QThread):
+    """Установка выбранных приложений вне потока интерфейса.
+
+    Все файлы всех приложений скачиваются параллельно (не больше workers
+    загрузок) во временную папку рядом с install_dir; в install_dir они
+    переносятся, только когда всё приложение скачано без ошибок.
+    """
+
+    file_progress = Signal(str, int)
+    total_progress = Signal(int)
+    app_installed = Signal(int)
+    app_failed = Signal(str, str)
+
+    def __init__(self, apps, nssm_url, downloader, workers):
+        super().__init__()
+        self.apps = apps
+        self.nssm_url = nssm_url
+        self.downloader = downloader
+        self.workers = workers
+        # Проценты по файлам: заполняется до первой загрузки, меняется из потоков пула
+        self.fractions = {}
+        self.fractions_lock = threading.Lock()
+        self.failed = 0
+
+    def progress_callback(self, name):
+        last = [-1]
+
+        def progress(received, total):
+            percent = received * 100 // total if total else 0
+            # Сигнал только при смене процента, чтобы не заваливать очередь событий
+            if percent != last[0]:
+                last[0] = percent
+                with self.fractions_lock:
+                    self.fractions[name] = percent
+                    total = sum(self.fractions.values()) // len(self.fractions)
+                self.file_progress.emit(name, percent)
+                self.total_progress.emit(total)
+        return progress
+
+    def fetch(self, url, path, sha256=None, installed=None, label=None):
+        # label — строка прогресса: у разных приложений бывают файлы с одинаковым именем
+        name = os.path.basename(path)
+        progress = self.progress_callback(label or name)
+        if installed is None:
+            self.downloader.fetch(url, path, sha256, progress=progress)
+            return
+        # Архив распаковывается в корень staging, рядом с остальными файлами приложения
+        staging = os.path.dirname(os.path.dirname(path))
+        try:
+            try:
+                extract_remote(url, staging, installed, self.downloader.session, self.workers, progress)
+            except ArchiveUnsupported as e:
+                print(f"Архив {name} будет скачан целиком: {e}")
+                self.downloader.fetch(url, path, progress=progress)
+                extract_local(path, staging, installed, self.workers)
+                os.remove(path)
+            # Если все файлы архива уже установлены, скачивать было нечего
+            progress(1, 1)
+        except BadZipFile:
+            raise Exception(f"Файл не является ZIP: {url}")
+
+    def run(self):
+        nssm_path = os.path.join(os.getenv("TEMP", ""), "nssm.exe")
+        need_nssm = any(app.get("register_service") for _, app in self.apps) and not os.path.exists(nssm_path)
+        # Все файлы учитываются в общем прогрессе до первой загрузки, иначе он дойдёт до 100% и откатится
+        labeled = []
+        for index, app in self.apps:
+            staging = staging_dir(app["install_dir"])
+            shutil.rmtree(staging, ignore_errors=True)
+            jobs = [(*job, f"{app['name']}: {os.path.relpath(job[1], staging)}")
+                    for job in app_downloads(app, staging)]
+            labeled.append((index, app, staging, jobs))
+        with self.fractions_lock:
+            self.fractions = {job[-1]: 0 for _, _, _, jobs in labeled for job in jobs}
+            if need_nssm:
+                self.fractions['nssm.exe'] = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            nssm_future = None
+            if need_nssm:
+                nssm_future = pool.submit(self.fetch, self.nssm_url, nssm_path)
+            planned = []
+            for index, app, staging, jobs in labeled:
+                futures = [pool.submit(self.fetch, *job) for job in jobs]
+                if app.get("register_service") and nssm_future:
+                    futures.append(nssm_future)
+                planned.append((index, app, staging, futures))
+            # Приложения устанавливаются по мере готовности их файлов
+            for index, app, staging, futures in planned:
+                wait(futures)
+                try:
+                    for future in futures:
+                        future.result()
+                    self.install_app(app, staging, nssm_path)
+                    self.app_installed.emit(index)
+                except Exception as e:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    self.failed += 1
+                    self.app_failed.emit(app['name'], str(e))
+
+    def install_app(self, app, staging, nssm_path):
+        install_dir = app["install_dir"]
+        commit_staging(staging, install_dir)
+        if app.get("register_service"):
+            local_exe_path = os.path.join(install_dir, os.path.basename(app["exe"]))
+            service_name = app["register_service"]
+            subprocess.run([nssm_path, "install", service_name, local_exe_path])
+            subprocess.run([nssm_path, "set", service_name, "Start", "SERVICE_AUTO_START"])
+            # После передачи сокета новой версии старый процесс выходит, служба должна перезапуститься
+            subprocess.run([nssm_path, "set", service_name, "AppExit", "Default", "Restart"])
+            subprocess.run(["sc", "start", service_name], check=False)
 
 class InstallerApp(QWidget):
     def __init__(self):
@@ -35,6 +240,11 @@ class InstallerApp(QWidget):
 
         self.checkboxes = []
         self.apps_data = []
+        self.workers = DOWNLOAD_WORKERS
+        self.session = pooled_session(self.workers)
+        self.downloader = Downloader(session=self.session)
+        self.worker = None
+        self.progress_items = {}
 
         self.scroll = QScrollArea()
         self.group = QGroupBox()
@@ -50,6 +260,13 @@ class InstallerApp(QWidget):
         self.install_button.clicked.connect(self.install_selected)
         self.layout.addWidget(self.install_button)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.hide()
+        self.layout.addWidget(self.progress_bar)
+        self.progress_list = QListWidget()
+        self.progress_list.hide()
+        self.layout.addWidget(self.progress_list)
+
         self.load_config()
 
     def apply_dark_theme(self):
@@ -82,9 +299,16 @@ class InstallerApp(QWidget):
 
     def load_config(self):
         try:
-            resp = requests.get(CONFIG_URL, timeout=10)
+            resp = self.session.get(CONFIG_URL, timeout=10)
             config = resp.json()
             self.nssm_url = f"{UPDATE_SERVER}/{config.get('nssm_url')}"
+            workers = config.get("download_workers", self.workers)
+            if workers != self.workers:
+                # Пул соединений должен соответствовать числу потоков загрузки
+                self.workers = workers
+                self.session.close()
+                self.session = pooled_session(self.workers)
+                self.downloader = Downloader(session=self.session)
             self.apps_data = config.get("apps", [])
 
             for app in self.apps_data:
@@ -102,69 +326,49 @@ class InstallerApp(QWidget):
             QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить конфигурацию: {e}")
 
     def install_selected(self):
-        for i, cb in enumerate(self.checkboxes):
-            if cb.isChecked():
-                self.install_app(self.apps_data[i])
-        QMessageBox.information(self, "Готово", "Выбранные программы установлены.")
+        apps = [(i, self.apps_data[i]) for i, cb in enumerate(self.checkboxes) if cb.isChecked()]
+        if not apps:
+            return
+        self.install_button.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.progress_list.clear()
+        self.progress_list.show()
+        self.progress_items = {}
+        self.worker = InstallWorker(apps, self.nssm_url, self.downloader, self.workers)
+        self.worker.file_progress.connect(self.on_file_progress)
+        self.worker.total_progress.connect(self.progress_bar.setValue)
+        self.worker.app_installed.connect(self.on_app_installed)
+        self.worker.app_failed.connect(self.on_app_failed)
+        self.worker.finished.connect(self.on_install_finished)
+        self.worker.start()
 
-    def install_app(self, app):
-        try:
-            exe_url = f"{UPDATE_SERVER}/{app['exe']}"
-            install_dir = app["install_dir"]
-            os.makedirs(install_dir, exist_ok=True)
-
-            exe_name = os.path.basename(app["exe"])
-            local_exe_path = os.path.join(install_dir, exe_name)
-
-            print(f"Скачиваю {exe_url}...")
-            with requests.get(exe_url, stream=True, timeout=30) as r:
-                with open(local_exe_path, "wb") as f:
-                    shutil.copyfileobj(r.raw, f)
-
-            if app.get("create_shortcut"):
-                desktop = os.path.join(os.environ["PUBLIC"], "Desktop")
-                shortcut_path = os.path.join(desktop, f"{app['name']}.lnk")
-                self.create_shortcut(local_exe_path, shortcut_path)
-
-            if app.get("register_service"):
-                nssm_path = os.path.join(os.getenv("TEMP"), "nssm.exe")
-                if not os.path.exists(nssm_path):
-                    with requests.get(self.nssm_url, stream=True, timeout=30) as r:
-                        with open(nssm_path, "wb") as f:
-                            shutil.copyfileobj(r.raw, f)
-                service_name = app["register_service"]
-                subprocess.run([nssm_path, "install", service_name, local_exe_path])
-                subprocess.run([nssm_path, "set", service_name, "Start", "SERVICE_AUTO_START"])
-                subprocess.run(["sc", "start", service_name], check=False)
-
-            for item in app.get("extra", []):
-                item_url = f"{UPDATE_SERVER}/{item}"
-                if item.endswith('/'):
-                    zip_name = os.path.basename(item.rstrip('/')) + ".zip"
-                    zip_url = f"{UPDATE_SERVER}/{os.path.dirname(item.rstrip('/'))}/{zip_name}"
-                    zip_path = os.path.join(install_dir, "_temp.zip")
-
-                    print(f"Пробуем скачать {zip_url}")
-                    with requests.get(zip_url, stream=True, timeout=30) as r:
-                        with open(zip_path, "wb") as f:
-                            shutil.copyfileobj(r.raw, f)
-                    try:
-                        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                            zip_ref.extractall(install_dir)
-                        os.remove(zip_path)
-                    except BadZipFile:
-                        raise Exception(f"Файл не является ZIP: {zip_path}")
-                else:
-                    print(f"Скачиваю файл: {item_url}")
-                    rel_path = os.path.relpath(item, start=os.path.dirname(app["exe"]))
-                    target_path = os.path.join(install_dir, rel_path)
-                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
-                    with requests.get(item_url, stream=True, timeout=30) as r:
-                        with open(target_path, "wb") as f:
-                            shutil.copyfileobj(r.raw, f)
+    def on_file_progress(self, name, percent):
+        item = self.progress_items.get(name)
+        if item is None:
+            self.progress_list.addItem(name)
+            item = self.progress_items[name] = self.progress_list.item(self.progress_list.count() - 1)
+        item.setText(f"{name} — {percent}%")
 
-        except Exception as e:
-            QMessageBox.warning(self, "Ошибка установки", f"Ошибка при установке {app['name']}: {e}")
+    def on_app_installed(self, index):
+        app = self.apps_data[index]
+        # Ярлык создаётся в потоке интерфейса: COM инициализирован только здесь
+        if app.get("create_shortcut"):
+            local_exe_path = os.path.join(app["install_dir"], os.path.basename(app["exe"]))
+            desktop = os.path.join(os.environ["PUBLIC"], "Desktop")
+            shortcut_path = os.path.join(desktop, f"{app['name']}.lnk")
+            self.create_shortcut(local_exe_path, shortcut_path)
+
+    def on_app_failed(self, name, error):
+        QMessageBox.warning(self, "Ошибка установки", f"Ошибка при установке {name}: {error}")
+
+    def on_install_finished(self):
+        self.install_button.setEnabled(True)
+        if self.worker.failed:
+            QMessageBox.information(self, "Готово", f"Установка завершена, с ошибками: {self.worker.failed}.")
+        else:
+            self.progress_bar.setValue(100)
+            QMessageBox.information(self, "Готово", "Выбранные программы установлены.")
 
     def create_shortcut(self, target, shortcut_path):
         try:
@@ -0,0 +1,72 @@
+"""Общие помощники локального IPC: адреса каналов, ключи и сеансы Windows.
+
+Используются каналом агента сеанса (agent.py) и каналом передачи
+сервера (handoff.py).
+"""
+import ctypes
+import os
+import subprocess
+import sys
+import tempfile
+from multiprocessing.connection import Listener
+
+# Права на файл ключа в Windows: владелец файла (OWNER RIGHTS), SYSTEM и Администраторы
+KEY_ACL = ('*S-1-3-4:F', '*S-1-5-18:F', '*S-1-5-32-544:F')
+
+
+def ipc_address(name):
+    """Адрес канала: именованный канал Windows или unix-сокет во временной папке"""
+    if sys.platform == 'win32':
+        return '\\\\.\\pipe\\' + name
+    return os.path.join(tempfile.gettempdir(), name + '.sock')
+
+
+def write_key(key_path):
+    """Новый ключ канала в файле с доступом только для владельца.
+
+    В Windows режим 0o600 не действует, поэтому до записи ключа права,
+    унаследованные от папки, заменяются явным ACL (владелец, SYSTEM,
+    Администраторы). OSError, если ACL задать не удалось.
+    """
+    authkey = os.urandom(32)
+    folder = os.path.dirname(key_path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        if sys.platform == 'win32':
+            restrict_acl(key_path)
+        f.write(authkey)
+    return authkey
+
+
+def restrict_acl(path):
+    """Явный ACL файла без наследования от папки (только Windows)"""
+    result = subprocess.run(['icacls', path, '/inheritance:r', '/grant:r', *KEY_ACL],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise OSError(f"Не удалось ограничить доступ к {path}: {(result.stdout + result.stderr).strip()}")
+
+
+def default_key_path(name):
+    """Файл ключа службы: %ProgramData%\\ekiller в Windows, рядом с сервером на других ОС"""
+    if sys.platform == 'win32':
+        return os.path.join(os.environ.get('ProgramData', r'C:\ProgramData'), 'ekiller', name)
+    return name
+
+
+def listen(address, authkey):
+    """Listener на address; unix-сокет, оставшийся от прошлого запуска, удаляется"""
+    if sys.platform != 'win32' and os.path.exists(address):
+        os.remove(address)
+    return Listener(address, authkey=authkey)
+
+
+def session_id(pid=None):
+    """Номер сеанса Windows процесса pid (по умолчанию текущего); None на других ОС или при ошибке"""
+    if sys.platform != 'win32':
+        return None
+    session = ctypes.c_ulong()
+    if ctypes.windll.kernel32.ProcessIdToSessionId(pid or os.getpid(), ctypes.byref(session)):
+        return session.value
+    return None
@@ -0,0 +1,221 @@
+"""Метрики сервера в текстовом формате Prometheus.
+
+Счётчики, датчики и гистограммы собираются в MetricsRegistry; отдать их
+можно по HTTP (MetricsServer, путь /metrics) или командой stats протокола.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонно растущий счётчик, опционально с метками.
+
+    func — счётчик, который ведёт другой объект: значение читается при
+    каждом обращении.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, description, func=None):
+        self.name = name
+        self.description = description
+        self.func = func
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        if self.func is not None:
+            return [(self.name, (), self.func())]
+        with self.lock:
+            items = list(self.values.items())
+        return [(self.name, labels, value) for labels, value in items]
+
+    def snapshot(self):
+        if self.func is not None:
+            return self.func()
+        with self.lock:
+            if list(self.values) == [()]:
+                return self.values[()]
+            return {','.join(f'{k}={v}' for k, v in labels): value for labels, value in self.values.items()}
+
+
+class Gauge:
+    """Текущее значение; может вычисляться функцией при каждом чтении"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, description, func=None):
+        self.name = name
+        self.description = description
+        self.func = func
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def get(self):
+        if self.func is not None:
+            return self.func()
+        with self.lock:
+            return self.value
+
+    def samples(self):
+        value = self.get()
+        if value is None:
+            return []
+        return [(self.name, (), value)]
+
+    def snapshot(self):
+        return self.get()
+
+
+class Histogram:
+    """Распределение длительностей по корзинам"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.lock = threading.Lock()
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self.lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append((self.name + '_bucket', (('le', format_value(bound)),), cumulative))
+        samples.append((self.name + '_sum', (), total))
+        samples.append((self.name + '_count', (), count))
+        return samples
+
+    def snapshot(self):
+        with self.lock:
+            return {'count': self.count, 'sum': self.sum}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, func=None):
+        return self.register(Counter(name, description, func))
+
+    def gauge(self, name, description, func=None):
+        return self.register(Gauge(name, description, func))
+
+    def histogram(self, name, description, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, description, buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Метрики в виде словаря для ответа на команду stats"""
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+
+class MetricsServer:
+    """HTTP-обработчик /metrics в отдельном потоке"""
+
+    def __init__(self, registry, host='127.0.0.1', port=9105):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        thread = threading.Thread(target=self.httpd.serve_forever, name='ekiller-metrics')
+        thread.daemon = True
+        thread.start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
@@ -0,0 +1,69 @@
+"""Кэш путей к программам на стороне клиента: имя процесса -> путь к exe.
+
+Если путь из настроек или аргументов не существует, клиент раньше искал
+программу обходом всех процессов с чтением exe у каждого — медленно и
+обычно впустую: единственный экземпляр только что завершил сервер.
+Теперь последний путь, по которому программа успешно запустилась,
+хранится в JSON рядом с журналом клиента. Запись используется, только
+пока файл по этому пути существует. Файл кэша перечитывается, когда его
+изменил другой процесс (другой лаунчер или агент сеанса).
+"""
+import json
+import os
+import tempfile
+from loguru import logger
+
+
+class PathCache:
+    """Последние рабочие пути к программам в файле path"""
+
+    def __init__(self, path):
+        self.path = path
+        self.paths = {}
+        # mtime файла при последнем чтении: по нему видно, что кэш изменился
+        self.mtime = None
+
+    def load(self):
+        """Перечитывание файла кэша, если он изменился с прошлого чтения"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self.paths, self.mtime = {}, None
+            return
+        if mtime == self.mtime:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                paths = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Кэш путей {self.path} не прочитан: {e}")
+            paths = {}
+        self.paths = paths if isinstance(paths, dict) else {}
+        self.mtime = mtime
+
+    def get(self, process_name):
+        """Сохранённый путь к программе или None, если записи нет или файла уже нет"""
+        self.load()
+        path = self.paths.get(process_name.lower())
+        if path and os.path.isfile(path):
+            return path
+        return None
+
+    def put(self, process_name, exe_path):
+        """Запоминание пути, по которому программа успешно запустилась"""
+        self.load()
+        key = process_name.lower()
+        if self.paths.get(key) == exe_path:
+            return
+        self.paths[key] = exe_path
+        folder = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(folder, exist_ok=True)
+            # Запись через временный файл: параллельный лаунчер не прочитает половину
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.paths, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+            self.mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш путей {self.path}: {e}")
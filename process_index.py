@@ -0,0 +1,241 @@
+from fnmatch import fnmatchcase
+import threading
+import time
+import psutil
+from loguru import logger
+from ipc import session_id
+
+
+class ProcessIndex:
+    """Индекс процессов: имя в нижнем регистре -> {pid: create_time}.
+
+    Обновляется инкрементально в фоновом потоке: при каждом проходе
+    запрашивается только список PID, а имя и время создания читаются
+    лишь для новых процессов. Раз в full_rescan секунд индекс строится
+    заново, чтобы не накапливать записи о переиспользованных PID. Перед
+    поиском индекс обновляется, если он старше max_age секунд (0 — перед
+    каждым поиском), иначе не были бы видны только что запущенные экземпляры.
+    """
+
+    def __init__(self, refresh_interval=2.0, full_rescan=60.0, process_table=psutil, max_age=0.0):
+        # Источник процессов: модуль psutil или совместимая с ним подмена
+        self.process_table = process_table
+        self.refresh_interval = refresh_interval
+        self.full_rescan = full_rescan
+        self.max_age = max_age
+        self.lock = threading.RLock()
+        self.by_name = {}
+        self.by_pid = {}
+        self.last_refresh = None
+        self.last_full_rescan = None
+        self.hits = 0
+        self.misses = 0
+        self.reused = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Первичное построение индекса и запуск фонового обновления"""
+        self.rebuild()
+        self.thread = threading.Thread(target=self._refresh_loop, name='ekiller-index')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _refresh_loop(self):
+        while not self.stop_event.wait(self.refresh_interval):
+            try:
+                if time.monotonic() - self.last_full_rescan >= self.full_rescan:
+                    self.rebuild()
+                else:
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Ошибка обновления индекса процессов: {e}")
+
+    def rebuild(self):
+        """Полное перестроение индекса"""
+        with self.lock:
+            self.by_name = {}
+            self.by_pid = {}
+            self.refresh()
+            self.last_full_rescan = self.last_refresh
+
+    def refresh(self):
+        """Инкрементальное обновление: читаются только появившиеся PID"""
+        pids = set(self.process_table.pids())
+        with self.lock:
+            known = set(self.by_pid)
+            for pid in known - pids:
+                self._forget(pid)
+            for pid in pids - known:
+                self._add(pid)
+            self.last_refresh = time.monotonic()
+
+    def _add(self, pid):
+        try:
+            proc = self.process_table.Process(pid)
+            name = proc.name().lower()
+            create_time = proc.create_time()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return None
+        self.by_pid[pid] = (name, create_time)
+        self.by_name.setdefault(name, {})[pid] = create_time
+        return name
+
+    def _forget(self, pid):
+        name, _ = self.by_pid.pop(pid, (None, None))
+        entries = self.by_name.get(name)
+        if entries is not None:
+            entries.pop(pid, None)
+            if not entries:
+                del self.by_name[name]
+
+    def ensure_fresh(self):
+        """Инкрементальное обновление, если индекс старше max_age"""
+        with self.lock:
+            if self.last_refresh is None or time.monotonic() - self.last_refresh >= self.max_age:
+                self.refresh()
+
+    def lookup(self, process_name):
+        """Живые процессы с указанным именем.
+
+        Каждый PID из индекса проверяется по времени создания: если PID
+        успел достаться другому процессу, запись переиндексируется.
+        """
+        self.ensure_fresh()
+        return self._lookup(process_name.lower())
+
+    def _lookup(self, name):
+        with self.lock:
+            entries = dict(self.by_name.get(name, {}))
+            if entries:
+                self.hits += 1
+            else:
+                self.misses += 1
+        procs = []
+        for pid, create_time in entries.items():
+            try:
+                proc = self.process_table.Process(pid)
+                if proc.create_time() == create_time:
+                    procs.append(proc)
+                    continue
+            except psutil.NoSuchProcess:
+                with self.lock:
+                    self._forget(pid)
+                continue
+            except psutil.AccessDenied:
+                continue
+            # PID переиспользован другим процессом
+            with self.lock:
+                self.reused += 1
+                self._forget(pid)
+                if self._add(pid) == name:
+                    procs.append(proc)
+        return procs
+
+    def match(self, targets):
+        """Процессы для каждого имени или шаблона из targets: {цель: [процессы]}.
+
+        Шаблоны сопоставляются с именами из одного снимка индекса; процесс
+        достаётся первой подходящей цели.
+        """
+        # Одно обновление на всю команду, а не на каждую цель
+        self.ensure_fresh()
+        with self.lock:
+            names = list(self.by_name)
+        matched = {}
+        claimed = set()
+        for target in targets:
+            found = matching_names(names, target) if is_pattern(target) else [target.lower()]
+            procs = [proc for name in found for proc in self._lookup(name) if proc.pid not in claimed]
+            claimed.update(proc.pid for proc in procs)
+            matched[target] = procs
+        return matched
+
+    def stats(self):
+        """Актуальность индекса и счётчики попаданий"""
+        with self.lock:
+            age = None
+            if self.last_refresh is not None:
+                age = time.monotonic() - self.last_refresh
+            return {
+                'age': age,
+                'processes': len(self.by_pid),
+                'names': len(self.by_name),
+                'hits': self.hits,
+                'misses': self.misses,
+                'reused': self.reused,
+            }
+
+
+def is_pattern(target):
+    """Цель команды — шаблон имени (*, ?, [...]), а не точное имя"""
+    return any(char in target for char in '*?[')
+
+
+def matching_names(names, pattern):
+    """Имена процессов (в нижнем регистре), подходящие под шаблон"""
+    pattern = pattern.lower()
+    return [name for name in names if fnmatchcase(name, pattern)]
+
+
+def match_target(name, targets):
+    """Первая цель из targets, под которую подходит имя процесса, или None"""
+    name = name.lower()
+    for target in targets:
+        if fnmatchcase(name, target.lower()) if is_pattern(target) else name == target.lower():
+            return target
+    return None
+
+
+def short_username(username):
+    """Имя пользователя без домена в нижнем регистре: DOMAIN\\user -> user"""
+    if not username:
+        return None
+    return username.rsplit('\\', 1)[-1].lower()
+
+
+class OwnerCache:
+    """Кэш владельцев процессов: (pid, create_time) -> (пользователь, сеанс).
+
+    Определение владельца через psutil дорогое (токен процесса и поиск
+    учётной записи), а владелец живого процесса не меняется, поэтому
+    результат кэшируется. Время создания в ключе защищает от
+    переиспользования PID.
+    """
+
+    def __init__(self, max_size=8192, process_table=psutil):
+        self.process_table = process_table
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.owners = {}
+
+    def lookup(self, proc):
+        """(пользователь без домена, номер сеанса) для процесса"""
+        try:
+            key = (proc.pid, proc.create_time())
+        except psutil.Error:
+            return None, None
+        with self.lock:
+            owner = self.owners.get(key)
+        if owner is not None:
+            return owner
+        try:
+            username = short_username(proc.username())
+        except psutil.Error:
+            username = None
+        owner = (username, session_id(proc.pid))
+        with self.lock:
+            if len(self.owners) >= self.max_size:
+                self._prune()
+            self.owners[key] = owner
+        return owner
+
+    def _prune(self):
+        # Вызывается под self.lock: убираем записи завершившихся процессов
+        alive = set(self.process_table.pids())
+        self.owners = {key: owner for key, owner in self.owners.items() if key[0] in alive}
+        if len(self.owners) >= self.max_size:
+            self.owners.clear()
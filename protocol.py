@@ -0,0 +1,176 @@
+"""Кадровый протокол EKiller.
+
+После подключения клиент отправляет приветствие MAGIC + версия (1 байт).
+Сервер, поддерживающий протокол, отвечает тем же приветствием с выбранной
+версией, после чего обе стороны обмениваются кадрами: 4 байта длины
+(big-endian) и JSON-объект в UTF-8. Каждый запрос несёт поле id, ответ
+возвращается с тем же id, поэтому на одном подключении может быть
+несколько незавершённых запросов, а ответы могут приходить в любом порядке.
+
+Старый сервер приветствие не распознаёт и не отвечает — клиент по таймауту
+продолжает на том же подключении в текстовом формате <user>_kill:<имя>.
+"""
+import itertools
+import json
+import socket
+import struct
+import threading
+from concurrent.futures import Future
+
+MAGIC = b"\x00EKP"
+VERSION = 1
+HELLO_SIZE = len(MAGIC) + 1
+HEADER = struct.Struct('>I')
+MAX_FRAME = 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def hello(version=VERSION):
+    """Приветствие с номером версии протокола"""
+    return MAGIC + bytes([version])
+
+
+def parse_hello(data):
+    """Версия из приветствия или None, если это не приветствие"""
+    if len(data) < HELLO_SIZE or not data.startswith(MAGIC):
+        return None
+    return data[len(MAGIC)]
+
+
+def encode_frame(message):
+    payload = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    if len(payload) > MAX_FRAME:
+        raise ProtocolError(f"Слишком большой кадр: {len(payload)} байт")
+    return HEADER.pack(len(payload)) + payload
+
+
+class FrameDecoder:
+    """Сборка кадров из произвольно разрезанного потока байт"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Добавить данные и вернуть список полностью принятых сообщений"""
+        self.buffer += data
+        messages = []
+        while len(self.buffer) >= HEADER.size:
+            (length,) = HEADER.unpack_from(self.buffer)
+            if length > MAX_FRAME:
+                raise ProtocolError(f"Слишком большой кадр: {length} байт")
+            end = HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            payload = bytes(self.buffer[HEADER.size:end])
+            del self.buffer[:end]
+            try:
+                message = json.loads(payload.decode('utf-8'))
+            except ValueError as e:
+                raise ProtocolError(f"Некорректный кадр: {e}")
+            if not isinstance(message, dict):
+                raise ProtocolError("Кадр должен содержать JSON-объект")
+            messages.append(message)
+        return messages
+
+
+def negotiate(sock, timeout=1.0):
+    """Согласование кадрового протокола на подключённом сокете.
+
+    Возвращает версию протокола или None, если сервер не ответил
+    приветствием за timeout секунд (старый сервер).
+    """
+    previous = sock.gettimeout()
+    sock.settimeout(timeout)
+    data = b""
+    try:
+        sock.sendall(hello())
+        while len(data) < HELLO_SIZE:
+            chunk = sock.recv(HELLO_SIZE - len(data))
+            if not chunk:
+                raise ConnectionError("Сервер закрыл соединение")
+            data += chunk
+    except socket.timeout:
+        return None
+    finally:
+        sock.settimeout(previous)
+    version = parse_hello(data)
+    if version is None:
+        raise ProtocolError(f"Неожиданный ответ на приветствие: {data!r}")
+    return version
+
+
+class ProtocolClient:
+    """Клиентская сторона кадрового протокола.
+
+    Запросы отправляются из любого потока, ответы разбираются фоновым
+    потоком чтения и сопоставляются с запросами по id.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.pending = {}
+        self.closed = False
+        self.reader = threading.Thread(target=self._read_loop, name='ekiller-protocol')
+        self.reader.daemon = True
+        self.reader.start()
+
+    def submit(self, message):
+        """Отправить запрос; возвращает Future с ответом сервера"""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("Соединение с сервером закрыто")
+            request_id = next(self.ids)
+            self.pending[request_id] = future
+        message = dict(message, id=request_id)
+        try:
+            self.send(message)
+        except Exception:
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise
+        return future
+
+    def request(self, message, timeout=None):
+        """Отправить запрос и дождаться ответа"""
+        return self.submit(message).result(timeout)
+
+    def send(self, message):
+        """Отправить сообщение, не ожидая ответа"""
+        with self.send_lock:
+            self.sock.sendall(encode_frame(message))
+
+    def _read_loop(self):
+        decoder = FrameDecoder()
+        error = ConnectionError("Соединение с сервером закрыто")
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                for message in decoder.feed(data):
+                    with self.lock:
+                        future = self.pending.pop(message.get('id'), None)
+                    if future is not None:
+                        future.set_result(message)
+        except Exception as e:
+            error = e
+        finally:
+            with self.lock:
+                self.closed = True
+                pending, self.pending = self.pending, {}
+            for future in pending.values():
+                future.set_exception(error)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
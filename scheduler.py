@@ -0,0 +1,153 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from process_index import is_pattern
+
+CONFLICT_KEYS = ('process', 'user', 'both')
+# Ключ цели-шаблона: заранее неизвестно, какие имена он покроет
+ANY_PROCESS = ('process', '*')
+
+
+def overlaps(keys, others):
+    """Конфликтуют ли наборы ключей; шаблон конфликтует с любым именем процесса"""
+    if keys & others:
+        return True
+    if ANY_PROCESS in keys:
+        return any(key[0] == 'process' for key in others)
+    if ANY_PROCESS in others:
+        return any(key[0] == 'process' for key in keys)
+    return False
+
+
+class KillBatch:
+    """Одинаковые команды, которые выполняются одним проходом"""
+
+    def __init__(self, target):
+        self.target = target
+        self.requests = []
+        self.keys = set()
+
+
+class KillScheduler:
+    """Планировщик команд завершения.
+
+    Команды, у которых совпадает ключ конфликта (имя процесса и/или
+    пользователь), выполняются строго по очереди в порядке поступления,
+    остальные — параллельно в пуле из workers потоков. Команда с шаблоном
+    имени (crash*.exe) конфликтует с любой командой по имени процесса.
+    Команды с одной и той же целью, пришедшие в течение coalesce_window
+    секунд, объединяются в одну пачку и передаются обработчику вместе.
+    """
+
+    def __init__(self, handler, workers=4, conflict_key='both', coalesce_window=0.0):
+        if conflict_key not in CONFLICT_KEYS:
+            raise ValueError(f"Неизвестный ключ конфликта: {conflict_key}")
+        self.handler = handler
+        self.workers = workers
+        self.conflict_key = conflict_key
+        self.coalesce_window = coalesce_window
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ekiller-kill')
+        self.lock = threading.Lock()
+        self.pending = []
+        self.active_keys = set()
+        # Пачки, которые ещё принимают одинаковые команды: цель -> KillBatch
+        self.collecting = {}
+        self.in_flight = 0
+
+    def keys_for(self, request):
+        """Набор ключей, по которым команда конфликтует с другими"""
+        keys = set()
+        if self.conflict_key in ('process', 'both'):
+            for target in request.targets:
+                keys.add(ANY_PROCESS if is_pattern(target) else ('process', target.lower()))
+        if self.conflict_key in ('user', 'both'):
+            keys.add(('user', request.username.lower()))
+        return keys
+
+    def target_for(self, request):
+        """Цель команды: одинаковые цели объединяются в одну пачку"""
+        return '|'.join(sorted({target.lower() for target in request.targets}))
+
+    def submit(self, request):
+        """Постановка команды в очередь планировщика"""
+        with self.lock:
+            batch = self.collecting.get(self.target_for(request))
+            if batch is not None:
+                keys = self.keys_for(request)
+                ahead = set()
+                for other in self.pending:
+                    ahead |= self.keys_for(other)
+                if not overlaps(keys - batch.keys, self.active_keys | ahead):
+                    self._join(batch, request, keys)
+                    return
+            self.pending.append(request)
+            self._dispatch()
+
+    def _join(self, batch, request, keys):
+        batch.requests.append(request)
+        batch.keys |= keys
+        self.active_keys |= keys
+
+    def _merge_pending(self, batch, blocked):
+        # Забираем из ожидания команды с той же целью, не обгоняя
+        # более ранние команды с пересекающимися ключами
+        skipped = set(blocked)
+        for other in list(self.pending):
+            keys = self.keys_for(other)
+            if self.target_for(other) == batch.target and not overlaps(keys - batch.keys, self.active_keys | skipped):
+                self.pending.remove(other)
+                self._join(batch, other, keys)
+            else:
+                skipped |= keys
+
+    def _dispatch(self):
+        # Вызывается под self.lock. Ключи команд, оставшихся в ожидании,
+        # тоже блокируют более поздние команды — так сохраняется порядок
+        blocked = set()
+        for request in list(self.pending):
+            if request not in self.pending:
+                # Уже объединена с пачкой, запущенной на этом проходе
+                continue
+            keys = self.keys_for(request)
+            if overlaps(keys, self.active_keys) or overlaps(keys, blocked):
+                blocked |= keys
+                continue
+            self.pending.remove(request)
+            batch = KillBatch(self.target_for(request))
+            self._join(batch, request, keys)
+            self._merge_pending(batch, blocked)
+            if self.coalesce_window > 0:
+                self.collecting[batch.target] = batch
+            self.in_flight += 1
+            self.executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            if self.coalesce_window > 0:
+                # Окно объединения: одинаковые команды присоединяются к пачке
+                time.sleep(self.coalesce_window)
+                with self.lock:
+                    self.collecting.pop(batch.target, None)
+                    self._merge_pending(batch, set())
+            self.handler(batch.requests)
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении команд {batch.requests}: {e}")
+        finally:
+            with self.lock:
+                self.active_keys -= batch.keys
+                self.in_flight -= 1
+                self._dispatch()
+
+    def depth(self):
+        """Количество команд, ожидающих выполнения"""
+        with self.lock:
+            return len(self.pending)
+
+    def idle(self):
+        """Нет ни ожидающих, ни выполняемых команд"""
+        with self.lock:
+            return not self.pending and not self.in_flight
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
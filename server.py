@@ -1,51 +1,406 @@
 import socket
+import select
+import sys
 import threading
 import queue
 import time
+import asyncio
+import argparse
 from loguru import logger
 import psutil
 import os
 import configparser
+from collections import deque
+from protocol import (MAGIC, HELLO_SIZE, VERSION, FrameDecoder, ProtocolError,
+                      encode_frame, hello, parse_hello)
+from scheduler import KillScheduler
+from process_index import OwnerCache, ProcessIndex, match_target, short_username
+from metrics import MetricsRegistry, MetricsServer
+from audit import AuditLog
+from admission import AdmissionControl
+from handoff import HandoffListener, handoff_address, request_takeover, send_socket
+from ipc import default_key_path
+
+
+class KillRequest:
+    """Команда завершения процесса, полученная от клиента"""
+
+    def __init__(self, connection, process_name, username="unknown", request_id=None, session=None,
+                 targets=None):
+        self.connection = connection
+        self.process_name = process_name
+        # Имена или шаблоны процессов, завершаемых вместе; первый — основной процесс
+        self.targets = targets or [process_name]
+        self.username = username
+        # id запроса в кадровом протоколе (None для текстового формата)
+        self.request_id = request_id
+        # Номер сеанса Windows клиента, если клиент его передал
+        self.session = session
+        # Устанавливается, когда клиент подтвердил запуск (или отключился)
+        self.taskstart = threading.Event()
+
+    def wait_taskstart(self, timeout=None):
+        """Ожидание подтверждения запуска приложения от клиента"""
+        return self.taskstart.wait(timeout)
+
+    def __repr__(self):
+        return f"KillRequest({self.username}_kill:{'|'.join(self.targets)})"
+
+
+class ClientConnection:
+    """Подключение клиента: выбор протокола, разбор команд и отправка ответов.
+
+    Если первые байты — приветствие кадрового протокола, подключение
+    работает кадрами с id запросов, иначе — в старом текстовом формате.
+    """
+
+    def __init__(self, server, address, send):
+        self.server = server
+        self.address = address
+        self._write = send
+        # sendall из разных потоков (чтение, очередь команд) может
+        # перемешать байты кадров, поэтому запись идёт под отдельной блокировкой
+        self.send_lock = threading.Lock()
+        # None — протокол ещё не определён, затем 'text' или 'framed'
+        self.protocol = None
+        self.version = None
+        self.buffer = b""
+        self.decoder = FrameDecoder()
+        self.lock = threading.Lock()
+        # Команды, получившие ok-taskkill и ждущие taskstart-ok
+        self.awaiting = {}
+        self.awaiting_text = deque()
+        self.closed = False
+
+    def feed(self, data):
+        """Обработка порции данных, полученной от клиента"""
+        if self.protocol is None:
+            self.buffer += data
+            if self.buffer[:1] != MAGIC[:1]:
+                self.protocol = 'text'
+            elif len(self.buffer) < HELLO_SIZE:
+                return
+            else:
+                version = parse_hello(self.buffer)
+                if version is None:
+                    raise ProtocolError(f"Некорректное приветствие: {self.buffer!r}")
+                self.protocol = 'framed'
+                self.version = min(version, VERSION)
+                self.buffer = self.buffer[HELLO_SIZE:]
+                self._send(hello(self.version))
+                logger.info(f"Клиент {self.address}: кадровый протокол v{self.version}")
+            data, self.buffer = self.buffer, b""
+        if self.protocol == 'framed':
+            for message in self.decoder.feed(data):
+                self.handle_message(message)
+        elif data:
+            self.handle_text(data.decode('utf-8'))
+
+    def handle_text(self, data):
+        """Команда в текстовом формате"""
+        logger.info(f"Получена команда от {self.address}: {data}")
+        # Новый формат: <username>_kill:имя_процесса[|имя или шаблон...]
+        if "_kill:" in data:
+            try:
+                user_part, process_part = data.split('_kill:')
+                targets = [name.strip() for name in process_part.split('|') if name.strip()]
+                username = user_part
+                request = KillRequest(self, targets[0], username, targets=targets)
+            except Exception as e:
+                logger.error(f"Ошибка парсинга команды: {data}, {e}")
+                return
+            retry_after = self.server.admit(request)
+            if retry_after is not None:
+                self._send(f"busy:retry_after={retry_after:.1f}".encode('utf-8'))
+        elif data == "stats":
+            self._send(self.server.metrics.render().encode('utf-8'))
+        elif data == "taskstart-ok":
+            logger.info(f"Клиент {self.address} подтвердил запуск приложения")
+            with self.lock:
+                request = self.awaiting_text.popleft() if self.awaiting_text else None
+            if request:
+                request.taskstart.set()
+
+    def handle_message(self, message):
+        """Сообщение кадрового протокола"""
+        logger.info(f"Получена команда от {self.address}: {message}")
+        cmd = message.get('cmd')
+        request_id = message.get('id')
+        if cmd == 'kill':
+            # names — несколько имён или шаблонов, завершаемых одним проходом
+            targets = message.get('names') or [message.get('name') or '']
+            if not isinstance(targets, list) or not all(isinstance(name, str) for name in targets):
+                self.send_message({'id': request_id, 'status': 'error',
+                                   'error': "name должен быть строкой, names — списком строк"})
+                return
+            targets = [name for name in targets if name]
+            if not targets:
+                self.send_message({'id': request_id, 'status': 'error', 'error': "Не указано имя процесса"})
+                return
+            username = message.get('user') or "unknown"
+            request = KillRequest(self, targets[0], username, request_id, message.get('session'), targets)
+            retry_after = self.server.admit(request)
+            if retry_after is not None:
+                self.send_message({'id': request_id, 'status': 'busy', 'retry_after': round(retry_after, 1)})
+        elif cmd == 'taskstart-ok':
+            logger.info(f"Клиент {self.address} подтвердил запуск приложения (id={request_id})")
+            with self.lock:
+                request = self.awaiting.pop(request_id, None)
+            if request:
+                request.taskstart.set()
+        elif cmd == 'stats':
+            self.send_message({'id': request_id, 'status': 'ok', 'metrics': self.server.metrics.snapshot()})
+        else:
+            self.send_message({'id': request_id, 'status': 'error', 'error': f"Неизвестная команда: {cmd}"})
+
+    def send_message(self, message):
+        """Отправка кадра клиенту"""
+        if self.closed:
+            raise ConnectionError(f"Соединение с {self.address} закрыто")
+        self._send(encode_frame(message))
+
+    def reply_kill(self, request, killed, gone, alive, results=None):
+        """Ответ ok-taskkill; после него команда ждёт taskstart-ok.
+
+        results — счётчики по каждой цели команды: {цель: (killed, gone, alive)}.
+        """
+        with self.lock:
+            if self.closed:
+                request.taskstart.set()
+                raise ConnectionError(f"Соединение с {self.address} закрыто")
+            if self.protocol == 'framed':
+                self.awaiting[request.request_id] = request
+                reply = {
+                    'id': request.request_id,
+                    'status': 'ok-taskkill',
+                    'killed': killed,
+                    'gone': gone,
+                    'alive': alive,
+                }
+                if results and len(results) > 1:
+                    reply['results'] = {
+                        target: {'killed': k, 'gone': g, 'alive': a} for target, (k, g, a) in results.items()
+                    }
+                data = encode_frame(reply)
+            else:
+                self.awaiting_text.append(request)
+                data = self.server.format_kill_reply(killed, gone, alive, results).encode('utf-8')
+        self._send(data)
+
+    def _send(self, data):
+        """Отправка байтов клиенту целиком, без чередования с другими ответами"""
+        with self.send_lock:
+            self._write(data)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            waiting = list(self.awaiting.values()) + list(self.awaiting_text)
+            self.awaiting.clear()
+            self.awaiting_text.clear()
+        # Не держим очередь команд на отключившемся клиенте
+        for request in waiting:
+            request.taskstart.set()
+
 
 class EKillerServer:
-    def __init__(self, config_path='settings.inf'):
+    def __init__(self, config_path='settings.inf', process_table=psutil):
+        # Источник процессов: psutil или совместимая подмена (бенчмарки)
+        self.process_table = process_table
         # Чтение настроек
         config = configparser.ConfigParser()
         if os.path.exists(config_path):
             config.read(config_path)
-            host = config.get('Server', 'host', fallback='127.0.0.1')
-            port = config.getint('Server', 'port', fallback=5000)
-        else:
-            host = '127.0.0.1'
-            port = 5000
-        self.host = host
-        self.port = port
+        self.host = config.get('Server', 'host', fallback='127.0.0.1')
+        self.port = config.getint('Server', 'port', fallback=5000)
+        # threaded — поток на каждого клиента, asyncio — один цикл событий на всех
+        self.mode = config.get('Server', 'mode', fallback='threaded').strip().lower()
+        self.backlog = config.getint('Server', 'backlog', fallback=128)
+        # Верхняя граница ожидания выхода завершаемых процессов
+        self.kill_timeout = config.getfloat('Server', 'kill_timeout', fallback=10.0)
+        # all — во всех сеансах, user — только процессы пользователя, session — его сеанса
+        self.kill_scope = config.get('Server', 'kill_scope', fallback='all').strip().lower()
+        self.owners = OwnerCache(process_table=process_table)
+        # Добавлять к ok-taskkill счётчики killed/gone/alive (нужен новый клиент)
+        self.kill_report = config.getboolean('Server', 'kill_report', fallback=False)
+        # Завершать вместе с процессом всех его потомков: terminate, затем kill
+        # тем, кто не закрылся за kill_grace секунд
+        self.kill_tree = config.getboolean('Server', 'kill_tree', fallback=False)
+        self.kill_grace = config.getfloat('Server', 'kill_grace', fallback=3.0)
         self.server_socket = None
-        self.clients = []
-        self.command_queue = queue.Queue()
+        self.async_server = None
+        self.loop = None
+        self.clients = set()
+        self.clients_lock = threading.Lock()
+        # Допуск команд: длина очереди и частота команд пользователя/процесса
+        self.admission = AdmissionControl(
+            max_pending=config.getint('Admission', 'max_pending', fallback=0),
+            queue_retry=config.getfloat('Admission', 'queue_retry', fallback=2.0),
+            user_rate=config.getfloat('Admission', 'user_rate', fallback=0.0),
+            user_burst=config.getfloat('Admission', 'user_burst', fallback=10),
+            process_rate=config.getfloat('Admission', 'process_rate', fallback=0.0),
+            process_burst=config.getfloat('Admission', 'process_burst', fallback=50)
+        )
+        self.command_queue = queue.Queue(maxsize=self.admission.max_pending)
+        # Несвязанные команды выполняются параллельно, конфликтующие — по очереди
+        self.scheduler = KillScheduler(
+            self.execute_batch,
+            workers=config.getint('Scheduler', 'workers', fallback=4),
+            conflict_key=config.get('Scheduler', 'conflict_key', fallback='both').strip().lower(),
+            coalesce_window=config.getfloat('Scheduler', 'coalesce_window', fallback=0.0)
+        )
+        # Пауза после taskstart-ok, в течение которой команда держит ключи конфликта
+        self.settle_delay = config.getfloat('Scheduler', 'settle_delay', fallback=5.0)
+        # Сколько ждать taskstart-ok: клиент шлёт его не позже restart_delay после запуска
+        restart_delay = config.getfloat('Process', 'restart_delay', fallback=5.0)
+        self.taskstart_timeout = config.getfloat('Scheduler', 'taskstart_timeout', fallback=restart_delay * 2)
+        # Индекс процессов по имени вместо полного обхода на каждую команду
+        self.index = None
+        if config.getboolean('Index', 'enabled', fallback=True):
+            self.index = ProcessIndex(
+                refresh_interval=config.getfloat('Index', 'refresh_interval', fallback=2.0),
+                full_rescan=config.getfloat('Index', 'full_rescan', fallback=60.0),
+                max_age=config.getfloat('Index', 'max_age', fallback=0.0),
+                process_table=process_table
+            )
+        # Передача слушающего сокета новому экземпляру при обновлении
+        self.handoff = None
+        if config.getboolean('Handoff', 'enabled', fallback=True):
+            self.handoff = HandoffListener(
+                handoff_address(self.port),
+                # Пустой key_path — %ProgramData%\ekiller\handoff.key (в Windows)
+                os.path.expandvars(config.get('Handoff', 'key_path', fallback='')) or default_key_path('handoff.key'),
+                self.hand_off
+            )
+        self.takeover_timeout = config.getfloat('Handoff', 'takeover_timeout', fallback=10.0)
+        self.drain_timeout = config.getfloat('Handoff', 'drain_timeout', fallback=60.0)
+        # Канал к предыдущему экземпляру, пока тот доводит свои команды
+        self.predecessor = None
+        # Сброшено, пока предыдущий экземпляр не закончил: команды ждут в очереди
+        self.dispatch_allowed = threading.Event()
+        self.dispatch_allowed.set()
+        self.accepting = False
+        self.accept_done = threading.Event()
+        self.stopped = threading.Event()
         self.running = False
+        self.setup_logging(config)
+        self.setup_metrics()
+        self.metrics_server = None
+        if config.getboolean('Metrics', 'enabled', fallback=False):
+            self.metrics_server = MetricsServer(
+                self.metrics,
+                host=config.get('Metrics', 'host', fallback='127.0.0.1'),
+                port=config.getint('Metrics', 'port', fallback=9105)
+            )
+
+    def setup_logging(self, config):
+        """Журнал server.log: через буфер AuditLog или напрямую в файл"""
+        self.audit = None
+        if not config.getboolean('Audit', 'enabled', fallback=True):
+            self.log_sink = logger.add("server.log", rotation="1 day", retention="7 days")
+            return
+        self.audit = AuditLog(
+            "server.log",
+            events_path=config.get('Audit', 'kill_events', fallback='').strip() or None,
+            buffer_size=config.getint('Audit', 'buffer_size', fallback=10000),
+            flush_interval=config.getfloat('Audit', 'flush_interval', fallback=0.5),
+            overflow=config.get('Audit', 'overflow', fallback='drop').strip().lower()
+        )
+        self.log_sink = logger.add(self.audit.sink)
+
+    def setup_metrics(self):
+        """Метрики для /metrics и команды stats"""
+        self.metrics = MetricsRegistry()
+        m = self.metrics
+        m.gauge('ekiller_queue_depth', "Команды, ожидающие выполнения",
+                lambda: self.command_queue.qsize() + self.scheduler.depth())
+        self.in_flight = m.gauge('ekiller_in_flight', "Команды в работе")
+        m.gauge('ekiller_connections', "Открытые подключения клиентов", lambda: len(self.clients))
+        self.requests_total = m.counter('ekiller_requests_total', "Выполненные команды по имени процесса")
+        self.coalesced_total = m.counter('ekiller_coalesced_total', "Команды, объединённые с другими")
+        self.rejected_total = m.counter('ekiller_rejected_total', "Команды, отклонённые с ответом busy")
+        self.kills_total = m.counter('ekiller_kills_total', "Завершённые процессы по имени")
+        self.scan_seconds = m.histogram('ekiller_scan_seconds', "Поиск процессов по имени")
+        self.kill_reply_seconds = m.histogram('ekiller_kill_reply_seconds', "От начала завершения до ответа ok-taskkill")
+        self.taskstart_wait_seconds = m.histogram('ekiller_taskstart_wait_seconds', "Ожидание taskstart-ok от клиента")
+        if self.index:
+            m.gauge('ekiller_index_age_seconds', "Время с последнего обновления индекса процессов",
+                    lambda: self.index.stats()['age'])
+            m.counter('ekiller_index_hits_total', "Поиски, нашедшие имя в индексе",
+                      lambda: self.index.stats()['hits'])
+            m.counter('ekiller_index_misses_total', "Поиски, не нашедшие имя в индексе",
+                      lambda: self.index.stats()['misses'])
+            m.counter('ekiller_index_reused_total', "PID из индекса, доставшиеся другому процессу",
+                      lambda: self.index.stats()['reused'])
+        if self.audit:
+            m.gauge('ekiller_audit_pending', "Строки журнала, ожидающие записи", self.audit.pending)
+            m.counter('ekiller_audit_dropped_total', "Строки журнала, отброшенные при переполнении буфера",
+                      lambda: self.audit.dropped)
         
-        # Настройка логирования
-        logger.add("server.log", rotation="1 day", retention="7 days")
-        
-    def start(self):
-        """Запуск сервера"""
+    def start(self, takeover=False):
+        """Запуск сервера.
+
+        takeover — только забрать сокет у работающего экземпляра (запуск
+        апдейтером); без работающего экземпляра сервер не запускается.
+        """
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            sock = self.open_listener(takeover)
+        except Exception as e:
+            logger.error(f"Ошибка запуска сервера: {e}")
+            self.stop()
+            return
+        if self.mode == 'asyncio':
+            self.start_async(sock)
+            return
+        try:
+            # Сокет, принятый от экземпляра в режиме asyncio, неблокирующий
+            sock.setblocking(True)
+            self.server_socket = sock
             self.running = True
+            self.accepting = True
             
             logger.info(f"Сервер запущен на {self.host}:{self.port}")
             
             # Запуск обработчика очереди команд
-            queue_thread = threading.Thread(target=self.process_command_queue)
-            queue_thread.daemon = True
-            queue_thread.start()
+            self.start_queue_thread()
+            self.start_handoff()
             
             # Основной цикл принятия подключений
-            while self.running:
+            self.accept_loop()
+            # После передачи сокета подключения обслуживаются до конца разгрузки
+            while not self.stopped.wait(1):
+                pass
+                    
+        except Exception as e:
+            logger.error(f"Ошибка запуска сервера: {e}")
+            self.stop()
+
+    def open_listener(self, takeover=False):
+        """Слушающий сокет: копия сокета работающего экземпляра или новый"""
+        if self.handoff:
+            taken = request_takeover(self.handoff.address, self.handoff.key_path, self.takeover_timeout)
+            if taken:
+                self.predecessor, sock = taken
+                # Команды выполняются после того, как предыдущий экземпляр доведёт свои
+                self.dispatch_allowed.clear()
+                logger.info(f"Слушающий сокет {sock.getsockname()} принят от работающего экземпляра")
+                return sock
+        if takeover:
+            raise RuntimeError("Нет работающего экземпляра сервера, у которого можно забрать сокет")
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        return sock
+
+    def accept_loop(self):
+        """Приём подключений, пока сервер не остановлен или не передан"""
+        try:
+            while self.accepting:
                 try:
+                    # Ожидание через select не меняет режим сокета, общего с другим экземпляром
+                    ready, _, _ = select.select([self.server_socket], [], [], 0.5)
+                    if not ready or not self.accepting:
+                        continue
                     client_socket, address = self.server_socket.accept()
                     logger.info(f"Новое подключение от {address}")
                     
@@ -55,93 +410,533 @@ class EKillerServer:
                     )
                     client_thread.daemon = True
                     client_thread.start()
-                    self.clients.append(client_thread)
                     
                 except Exception as e:
-                    logger.error(f"Ошибка при принятии подключения: {e}")
-                    
+                    if self.accepting:
+                        logger.error(f"Ошибка при принятии подключения: {e}")
+        finally:
+            self.accept_done.set()
+
+    def start_async(self, sock):
+        """Запуск сервера в режиме asyncio: все клиенты в одном цикле событий"""
+        try:
+            asyncio.run(self.serve_async(sock))
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
             logger.error(f"Ошибка запуска сервера: {e}")
             self.stop()
+
+    async def serve_async(self, sock):
+        self.loop = asyncio.get_running_loop()
+        await self.listen_async(sock)
+        self.running = True
+        logger.info(f"Сервер запущен на {self.host}:{self.port} (asyncio)")
+        self.start_queue_thread()
+        self.start_handoff()
+        # После передачи сокета подключения обслуживаются до конца разгрузки
+        while not self.stopped.is_set():
+            await asyncio.sleep(0.5)
+
+    async def listen_async(self, sock):
+        self.async_server = await asyncio.start_server(
+            self.handle_client_async, sock=sock, backlog=self.backlog
+        )
+        self.accepting = True
+
+    async def close_listener_async(self):
+        self.async_server.close()
+
+    def start_queue_thread(self):
+        if self.index:
+            self.index.start()
+        if self.metrics_server:
+            self.metrics_server.start()
+        queue_thread = threading.Thread(target=self.process_command_queue)
+        queue_thread.daemon = True
+        queue_thread.start()
+
+    def start_handoff(self):
+        """Подтверждение приёма сокета предыдущему экземпляру и свой канал передачи"""
+        if self.predecessor:
+            thread = threading.Thread(target=self.wait_predecessor, name='ekiller-predecessor')
+            thread.daemon = True
+            thread.start()
+        if self.handoff:
+            try:
+                self.handoff.start()
+            except OSError as e:
+                # Без защищённого ключа канал не открывается: обновление пойдёт через перезапуск службы
+                logger.error(f"Канал передачи сервера не открыт: {e}")
+                self.handoff = None
+
+    def wait_predecessor(self):
+        """Ожидание, пока предыдущий экземпляр доведёт принятые команды"""
+        conn = self.predecessor
+        try:
+            conn.send({'status': 'listening'})
+            if conn.poll(self.drain_timeout + self.takeover_timeout):
+                reply = conn.recv()
+                logger.info(f"Предыдущий экземпляр завершил работу, не выполнено команд: {reply.get('pending')}")
+            else:
+                logger.warning("Предыдущий экземпляр не сообщил о завершении, выполняю команды")
+        except (EOFError, OSError) as e:
+            logger.warning(f"Связь с предыдущим экземпляром потеряна: {e}")
+        finally:
+            conn.close()
+            self.predecessor = None
+            self.dispatch_allowed.set()
+
+    def stop_accepting(self):
+        """Прекращение приёма подключений; возвращает слушающий сокет для передачи"""
+        self.accepting = False
+        if self.async_server:
+            # asyncio закрывает свой сокет, поэтому передаётся его копия
+            listening = self.async_server.sockets[0]
+            self.server_socket = socket.fromfd(listening.fileno(), listening.family, listening.type)
+            asyncio.run_coroutine_threadsafe(self.close_listener_async(), self.loop).result()
+        else:
+            self.accept_done.wait()
+        return self.server_socket
+
+    def resume_accepting(self, sock):
+        """Возобновление приёма подключений, если передать сокет не удалось"""
+        if self.async_server:
+            self.server_socket = None
+            asyncio.run_coroutine_threadsafe(self.listen_async(sock), self.loop).result()
+            return
+        self.accepting = True
+        self.accept_done.clear()
+        accept_thread = threading.Thread(target=self.accept_loop)
+        accept_thread.daemon = True
+        accept_thread.start()
+
+    def hand_off(self, conn, pid):
+        """Передача слушающего сокета новому экземпляру (PID pid) и разгрузка.
+
+        Возвращает False, если передать сокет не удалось и сервер
+        продолжает принимать подключения.
+        """
+        logger.info(f"Новый экземпляр сервера (PID {pid}) забирает слушающий сокет")
+        sock = self.stop_accepting()
+        if self.metrics_server:
+            # Порт метрик освобождается для нового экземпляра
+            self.metrics_server.stop()
+        try:
+            conn.send({'status': 'ok'})
+            send_socket(conn, sock, pid)
+            if not conn.poll(self.takeover_timeout) or conn.recv().get('status') != 'listening':
+                raise ConnectionError("новый экземпляр не подтвердил приём сокета")
+        except Exception as e:
+            logger.error(f"Не удалось передать сервер новому экземпляру: {e}")
+            conn.close()
+            if self.metrics_server:
+                self.metrics_server.start()
+            self.resume_accepting(sock)
+            return False
+        self.metrics_server = None
+        logger.info("Приём подключений передан новому экземпляру, довожу принятые команды")
+        pending = self.drain()
+        try:
+            conn.send({'status': 'drained', 'pending': pending})
+        except OSError:
+            pass
+        conn.close()
+        self.stop()
+        return True
+
+    def drain(self):
+        """Ожидание выполнения принятых команд, не дольше drain_timeout.
+
+        Возвращает число команд, не выполненных к концу ожидания.
+        """
+        deadline = time.monotonic() + self.drain_timeout
+        while True:
+            pending = self.command_queue.unfinished_tasks + self.scheduler.depth() + self.in_flight.get()
+            if (not pending and self.scheduler.idle()) or time.monotonic() >= deadline:
+                if pending:
+                    logger.warning(f"За {self.drain_timeout} с не выполнено команд: {pending}")
+                return pending
+            time.sleep(0.1)
             
     def stop(self):
         """Остановка сервера"""
+        if self.stopped.is_set():
+            return
         self.running = False
+        self.accepting = False
+        if self.handoff:
+            self.handoff.close()
         if self.server_socket:
             self.server_socket.close()
+        if self.async_server and self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.async_server.close)
+        try:
+            self.command_queue.put_nowait(None)
+        except queue.Full:
+            # Очередь полна, значит обработчик не ждёт в get() и сам увидит running = False
+            pass
+        # Обработчик мог ждать, пока предыдущий экземпляр доведёт свои команды
+        self.dispatch_allowed.set()
+        # Команды, ждущие taskstart-ok, не должны задерживать выход
+        with self.clients_lock:
+            connections = list(self.clients)
+        for connection in connections:
+            connection.close()
+        self.scheduler.shutdown()
+        if self.index:
+            self.index.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
         logger.info("Сервер остановлен")
+        if self.audit:
+            # Дописываем буфер журнала до выхода
+            logger.remove(self.log_sink)
+            self.audit.close()
+        self.stopped.set()
+
+    def register_client(self, connection):
+        with self.clients_lock:
+            self.clients.add(connection)
+
+    def unregister_client(self, connection):
+        connection.close()
+        with self.clients_lock:
+            self.clients.discard(connection)
         
     def handle_client(self, client_socket, address):
         """Обработка клиентского подключения"""
+        connection = ClientConnection(self, address, client_socket.sendall)
+        self.register_client(connection)
         try:
             while self.running:
-                data = client_socket.recv(1024).decode('utf-8')
+                data = client_socket.recv(1024)
                 if not data:
                     break
-                logger.info(f"Получена команда от {address}: {data}")
-                # Новый формат: <username>_kill:имя_процесса
-                if "_kill:" in data:
-                    try:
-                        user_part, process_part = data.split('_kill:')
-                        process_name = process_part
-                        username = user_part
-                        self.command_queue.put((client_socket, process_name, username))
-                    except Exception as e:
-                        logger.error(f"Ошибка парсинга команды: {data}, {e}")
-                elif data == "taskstart-ok":
-                    logger.info(f"Клиент {address} подтвердил запуск приложения")
+                connection.feed(data)
         except Exception as e:
             logger.error(f"Ошибка при обработке клиента {address}: {e}")
         finally:
+            self.unregister_client(connection)
             client_socket.close()
             logger.info(f"Соединение с {address} закрыто")
+
+    async def handle_client_async(self, reader, writer):
+        """Обработка клиентского подключения в цикле событий"""
+        address = writer.get_extra_info('peername')
+        logger.info(f"Новое подключение от {address}")
+        loop = asyncio.get_running_loop()
+        # Ответы отправляются из потока очереди команд, поэтому запись
+        # передаётся в цикл событий через call_soon_threadsafe
+        connection = ClientConnection(
+            self, address, lambda data: loop.call_soon_threadsafe(writer.write, data)
+        )
+        self.register_client(connection)
+        try:
+            while self.running:
+                data = await reader.read(1024)
+                if not data:
+                    break
+                connection.feed(data)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке клиента {address}: {e}")
+        finally:
+            self.unregister_client(connection)
+            writer.close()
+            logger.info(f"Соединение с {address} закрыто")
             
+    def admit(self, request):
+        """Постановка команды в очередь.
+
+        Возвращает None, если команда принята, иначе retry_after — через
+        сколько секунд клиенту стоит повторить запрос.
+        """
+        pending = self.command_queue.qsize() + self.scheduler.depth()
+        verdict = self.admission.check(
+            short_username(request.username), request.process_name.lower(), pending
+        )
+        if verdict is None:
+            try:
+                self.command_queue.put_nowait(request)
+                return None
+            except queue.Full:
+                verdict = ('queue', self.admission.queue_retry)
+        reason, retry_after = verdict
+        self.rejected_total.inc(reason=reason)
+        logger.info(f"Команда {request} отклонена ({reason}), повтор через {retry_after:.1f} с")
+        return retry_after
+
     def process_command_queue(self):
         """Обработка очереди команд"""
-        while self.running:
+        while True:
+            # Блокирующее ожидание: в простое поток не расходует процессор
+            request = self.command_queue.get()
+            if request is None or not self.running:
+                # Пустая команда от stop() или сервер уже остановлен — завершение обработчика
+                break
+            # Пока предыдущий экземпляр доводит свои команды, новые ждут в очереди
+            self.dispatch_allowed.wait()
+            if not self.running:
+                break
             try:
-                if not self.command_queue.empty():
-                    # Теперь очередь содержит username
-                    item = self.command_queue.get()
-                    if len(item) == 3:
-                        client_socket, process_name, username = item
-                    else:
-                        client_socket, process_name = item
-                        username = "unknown"
-                    # Завершение процесса во всех сессиях
-                    self.kill_process(process_name, username)
-                    logger.info("Ожидание 2 секунды после завершения процесса")
-                    time.sleep(2)
-                    client_socket.send("ok-taskkill".encode('utf-8'))
-                    while True:
-                        try:
-                            data = client_socket.recv(1024).decode('utf-8')
-                            if data == "taskstart-ok":
-                                break
-                        except:
-                            break
-                    time.sleep(5)
+                self.scheduler.submit(request)
             except Exception as e:
                 logger.error(f"Ошибка при обработке очереди команд: {e}")
-                
-    def kill_process(self, process_name, username="unknown"):
-        """Завершение процесса во всех сессиях с логированием пользователя"""
+            finally:
+                self.command_queue.task_done()
+
+    def execute_batch(self, requests):
+        """Выполнение пачки одинаковых команд в потоке планировщика.
+
+        Процессы завершаются одним проходом, а ответ получает каждый
+        клиент, приславший команду.
+        """
+        targets = requests[0].targets
+        usernames = list(dict.fromkeys(request.username for request in requests))
+        self.in_flight.inc(len(requests))
+        try:
+            self.run_batch(targets, usernames, requests)
+        finally:
+            self.in_flight.dec(len(requests))
+
+    def run_batch(self, targets, usernames, requests):
+        started = time.monotonic()
+        process_name = "|".join(targets)
+        self.requests_total.inc(len(requests), process=targets[0].lower())
+        # Завершение процессов всех целей команды во всех сессиях
+        killed = self.kill_process(targets, ", ".join(usernames), requests)
+        procs = [proc for found in killed.values() for proc in found]
+        if len(requests) > 1:
+            self.coalesced_total.inc(len(requests) - 1)
+            pids = [proc.pid for proc in procs]
+            for request in requests:
+                logger.info(
+                    f"Пользователь {request.username}: запрос на завершение {process_name} "
+                    f"объединён с другими ({len(requests)} шт.), завершены PID: {pids}"
+                )
+        # Ответ отправляется, как только процессы действительно завершились
+        gone, alive = self.confirm_exit(process_name, procs)
+        alive_pids = {proc.pid for proc in alive}
+        results = {}
+        for target, found in killed.items():
+            still_alive = sum(proc.pid in alive_pids for proc in found)
+            results[target] = (len(found), len(found) - still_alive, still_alive)
+        if self.audit:
+            self.audit.event(
+                'kill',
+                process=targets[0],
+                targets=targets,
+                users=usernames,
+                pids=[proc.pid for proc in procs],
+                gone=[proc.pid for proc in gone],
+                alive=[proc.pid for proc in alive],
+                seconds=round(time.monotonic() - started, 3)
+            )
+        for request in requests:
+            try:
+                request.connection.reply_kill(request, len(procs), len(gone), len(alive), results)
+            except Exception as e:
+                logger.error(f"Не удалось отправить ответ {request.connection.address}: {e}")
+        replied = time.monotonic()
+        self.kill_reply_seconds.observe(replied - started)
+        # Подтверждение приходит через поток чтения подключения
+        # Один зависший клиент не должен держать ключи всей пачки и поток пула
+        deadline = replied + self.taskstart_timeout
+        for request in requests:
+            if not request.wait_taskstart(max(0.0, deadline - time.monotonic())):
+                logger.warning(
+                    f"Пользователь {request.username}: нет taskstart-ok за {self.taskstart_timeout} с, "
+                    f"команда {request} завершена без подтверждения"
+                )
+                continue
+            self.taskstart_wait_seconds.observe(time.monotonic() - replied)
+        # Ключи конфликта удерживаются, пока приложение запускается
+        time.sleep(self.settle_delay)
+
+    def confirm_exit(self, process_name, procs):
+        """Ожидание фактического завершения процессов, не дольше kill_timeout.
+
+        Возвращает списки завершившихся и ещё живых процессов.
+        """
+        if not procs:
+            return [], []
+        started = time.monotonic()
+        gone, alive = self.process_table.wait_procs(procs, timeout=self.kill_timeout)
+        elapsed = time.monotonic() - started
+        if alive:
+            logger.warning(
+                f"Процесс {process_name}: за {self.kill_timeout} с не завершились PID "
+                f"{[proc.pid for proc in alive]}"
+            )
+        else:
+            logger.info(f"Процесс {process_name}: завершение подтверждено за {elapsed:.2f} с")
+        return gone, alive
+
+    def format_kill_reply(self, killed, gone, alive, results=None):
+        """Ответ ok-taskkill; при kill_report к нему добавляются счётчики"""
+        if not self.kill_report:
+            return "ok-taskkill"
+        reply = f"ok-taskkill:killed={killed};gone={gone};alive={alive}"
+        if results and len(results) > 1:
+            # Счётчики каждой цели: <имя или шаблон>=killed/gone/alive
+            reply += "".join(f";{target}={k}/{g}/{a}" for target, (k, g, a) in results.items())
+        return reply
+
+    def find_processes(self, targets):
+        """Процессы для каждого имени или шаблона во всех сессиях: {цель: [процессы]}"""
+        with self.scan_seconds.time():
+            return self.scan_processes(targets)
+
+    def scan_processes(self, targets):
+        if self.index:
+            matched = self.index.match(targets)
+            stats = self.index.stats()
+            logger.debug(
+                f"Индекс процессов: обновлён {stats['age']:.1f} с назад, "
+                f"попаданий {stats['hits']}, промахов {stats['misses']}"
+            )
+            return matched
+        # Один проход по таблице процессов на все цели команды
+        matched = {target: [] for target in targets}
+        for proc in self.process_table.process_iter(['pid', 'name']):
+            target = match_target(proc.info['name'] or '', targets)
+            if target is not None:
+                matched[target].append(proc)
+        return matched
+
+    def in_scope(self, proc, requests):
+        """Принадлежит ли процесс пользователю (или сеансу) одной из команд"""
+        username, session = self.owners.lookup(proc)
+        for request in requests:
+            if self.kill_scope == 'session' and request.session is not None:
+                if session == request.session:
+                    return True
+            elif username is not None and username == short_username(request.username):
+                return True
+        return False
+
+    def kill_process(self, targets, username="unknown", requests=None):
+        """Завершение процессов по именам или шаблонам во всех сессиях.
+
+        При kill_scope = user/session завершаются только процессы
+        пользователей (сеансов), приславших команды requests. При kill_tree
+        завершается всё дерево процессов: сначала terminate, затем kill
+        тем, кто не закрылся за kill_grace секунд.
+        Возвращает {цель: [процессы, которым был отправлен сигнал завершения]}.
+        """
+        killed = {target: [] for target in targets}
+        scoped = self.kill_scope != 'all' and requests
         try:
-            for proc in psutil.process_iter(['pid', 'name']):
-                if proc.info['name'].lower() == process_name.lower():
+            if self.kill_tree:
+                # Совпадения и их потомки берутся из одного снимка таблицы процессов
+                found, children = self.scan_tree(targets)
+            else:
+                found = self.find_processes(targets)
+            if scoped:
+                found = {target: [proc for proc in procs if self.in_scope(proc, requests)]
+                         for target, procs in found.items()}
+            if self.kill_tree:
+                found = self.with_descendants(found, children)
+            for target, procs in found.items():
+                for proc in procs:
                     try:
-                        proc.kill()
-                        logger.info(f"Пользователь {username}: процесс {process_name} (PID: {proc.info['pid']}) завершён")
+                        if self.kill_tree:
+                            proc.terminate()
+                        else:
+                            proc.kill()
+                        killed[target].append(proc)
                     except psutil.NoSuchProcess:
                         pass
                     except psutil.AccessDenied:
-                        logger.warning(f"Нет прав для завершения процесса {process_name}")
+                        logger.warning(f"Нет прав для завершения процесса {target} (PID {proc.pid})")
+            if self.kill_tree:
+                self.escalate([proc for procs in killed.values() for proc in procs])
         except Exception as e:
-            logger.error(f"Ошибка при завершении процесса {process_name}: {e}")
+            logger.error(f"Ошибка при завершении процессов {'|'.join(targets)}: {e}")
+        for target, procs in killed.items():
+            if procs:
+                # Одна строка журнала на цель, а не на каждый PID
+                self.kills_total.inc(len(procs), process=target.lower())
+                logger.info(
+                    f"Пользователь {username}: процесс {target} завершён, "
+                    f"PID: {[proc.pid for proc in procs]}"
+                )
+        return killed
+
+    def scan_tree(self, targets):
+        """Один проход по процессам: {цель: [процессы]} и {ppid: [дочерние процессы]}.
+
+        Для завершения дерева индекс не используется: таблица родителей
+        всё равно требует полного обхода.
+        """
+        matched = {target: [] for target in targets}
+        children = {}
+        with self.scan_seconds.time():
+            for proc in self.process_table.process_iter(['pid', 'name', 'ppid']):
+                children.setdefault(proc.info.get('ppid'), []).append(proc)
+                target = match_target(proc.info['name'] or '', targets)
+                if target is not None:
+                    matched[target].append(proc)
+        return matched, children
+
+    def with_descendants(self, found, children):
+        """Найденные процессы вместе со всеми потомками по таблице children из scan_tree"""
+        claimed = {proc.pid for procs in found.values() for proc in procs}
+        tree = {}
+        for target, procs in found.items():
+            tree[target] = list(procs)
+            stack = list(procs)
+            while stack:
+                parent = stack.pop()
+                for child in children.get(parent.pid, []):
+                    if child.pid in claimed or not started_after(child, parent):
+                        continue
+                    claimed.add(child.pid)
+                    tree[target].append(child)
+                    stack.append(child)
+        return tree
+
+    def escalate(self, procs):
+        """kill процессам, не завершившимся за kill_grace после terminate.
+
+        Процессы ждутся все вместе, поэтому пауза не длиннее kill_grace,
+        сколько бы их ни было.
+        """
+        if not procs:
+            return
+        _, alive = self.process_table.wait_procs(procs, timeout=self.kill_grace)
+        for proc in alive:
+            try:
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
+            except psutil.AccessDenied:
+                logger.warning(f"Нет прав для принудительного завершения PID {proc.pid}")
+        if alive:
+            logger.info(
+                f"За {self.kill_grace} с не закрылись PID {[proc.pid for proc in alive]}, "
+                f"отправлен kill"
+            )
+
+
+def started_after(child, parent):
+    """Потомок запущен не раньше родителя (PID родителя мог достаться другому процессу)"""
+    try:
+        return child.create_time() >= parent.create_time()
+    except psutil.Error:
+        return False
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="server.py", description="Сервер EKiller")
+    parser.add_argument('--takeover', action='store_true',
+                        help="забрать слушающий сокет у работающего экземпляра (обновление без простоя)")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
     server = EKillerServer('settings.inf')
     try:
-        server.start()
+        server.start(takeover=args.takeover)
     except KeyboardInterrupt:
         server.stop() 
\ No newline at end of file
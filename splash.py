@@ -0,0 +1,66 @@
+import os
+from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel
+from PySide6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve
+from PySide6.QtGui import QPixmap
+from loguru import logger
+
+class SplashScreen(QWidget):
+    def __init__(self, logo_path, logo_size, duration):
+        super().__init__()
+        logger.info(f"Инициализация сплэш-скрина: logo_path={logo_path}, size={logo_size}, duration={duration}")
+        
+        self.setWindowFlags(Qt.FramelessWindowHint)
+        self.setAttribute(Qt.WA_TranslucentBackground)
+        
+        # Создаем layout
+        layout = QVBoxLayout()
+        layout.setAlignment(Qt.AlignCenter)
+        self.setLayout(layout)
+        
+        # Создаем и настраиваем логотип
+        self.logo_label = QLabel()
+        self.logo_label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.logo_label)
+        
+        # Загружаем и устанавливаем логотип
+        if not os.path.exists(logo_path):
+            logger.error(f"Файл логотипа не найден: {logo_path}")
+            raise FileNotFoundError(f"Файл логотипа не найден: {logo_path}")
+            
+        pixmap = QPixmap(logo_path)
+        if pixmap.isNull():
+            logger.error(f"Не удалось загрузить логотип: {logo_path}")
+            raise ValueError(f"Не удалось загрузить логотип: {logo_path}")
+            
+        scaled_pixmap = pixmap.scaled(logo_size, logo_size, Qt.KeepAspectRatio,
+                                    Qt.SmoothTransformation)
+        self.logo_label.setPixmap(scaled_pixmap)
+        
+        # Увеличиваем размер окна, чтобы логотип не обрезался
+        padding = 40
+        self.setFixedSize(logo_size + padding * 2, logo_size + padding * 2)
+        
+        # Настройка анимации
+        self.animation = QPropertyAnimation(self, b"windowOpacity")
+        self.animation.setDuration(2500)
+        self.animation.setStartValue(0.0)
+        self.animation.setEndValue(1.0)
+        self.animation.setEasingCurve(QEasingCurve.InOutQuad)
+        
+        # Таймер для закрытия сплэша
+        self.close_timer = QTimer()
+        self.close_timer.setSingleShot(True)
+        self.close_timer.timeout.connect(self.close)
+        self.close_timer.start(duration)
+        logger.info("Сплэш-скрин инициализирован")
+        
+    def showEvent(self, event):
+        # Центрируем окно на экране
+        screen = QApplication.primaryScreen()
+        screen_geometry = screen.geometry()
+        x = (screen_geometry.width() - self.width()) // 2
+        y = (screen_geometry.height() - self.height()) // 2
+        self.move(x, y)
+        super().showEvent(event)
+        self.animation.start()
+        logger.info("Сплэш-скрин показан")
@@ -0,0 +1,159 @@
+"""Блочные дельта-обновления exe.
+
+Рядом с каждой сборкой на сервере обновлений публикуется манифест
+<exe>.blocks.json с SHA-256 каждого блока файла:
+
+    python delta.py make Killer_Client.exe
+
+Апдейтер сравнивает блоки манифеста с блоками текущего exe, скачивает
+по HTTP Range только отличающиеся и собирает новый файл локально. Если
+манифеста нет, сервер не поддерживает Range или итоговый хеш не сошёлся,
+вызывающий код скачивает файл целиком.
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+
+import requests
+
+BLOCK_SIZE = 64 * 1024
+MANIFEST_SUFFIX = '.blocks.json'
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaUnavailable(Exception):
+    """Дельта-обновление невозможно, нужно скачать файл целиком"""
+
+
+def iter_blocks(path, block_size=BLOCK_SIZE):
+    """(смещение, данные) для каждого блока файла"""
+    with open(path, 'rb') as f:
+        offset = 0
+        while True:
+            data = f.read(block_size)
+            if not data:
+                return
+            yield offset, data
+            offset += len(data)
+
+
+def build_manifest(path, block_size=BLOCK_SIZE):
+    whole = hashlib.sha256()
+    blocks = []
+    for _, data in iter_blocks(path, block_size):
+        whole.update(data)
+        blocks.append(hashlib.sha256(data).hexdigest())
+    return {
+        'size': os.path.getsize(path),
+        'block_size': block_size,
+        'sha256': whole.hexdigest(),
+        'blocks': blocks,
+    }
+
+
+def write_manifest(path, block_size=BLOCK_SIZE):
+    """Манифест блоков и файл .sha256 для публикации рядом с exe"""
+    manifest = build_manifest(path, block_size)
+    with open(path + MANIFEST_SUFFIX, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    # Хеш всего файла в формате sha256sum — его проверяет downloader.py
+    with open(path + '.sha256', 'w', encoding='utf-8') as f:
+        f.write(f"{manifest['sha256']}  {os.path.basename(path)}\n")
+    return path + MANIFEST_SUFFIX
+
+
+def local_index(path, block_size):
+    """SHA-256 блока -> смещение в текущем файле"""
+    index = {}
+    for offset, data in iter_blocks(path, block_size):
+        index.setdefault(hashlib.sha256(data).hexdigest(), offset)
+    return index
+
+
+def fetch_manifest(url, session=requests, timeout=10):
+    resp = session.get(url + MANIFEST_SUFFIX, timeout=timeout)
+    if resp.status_code != 200:
+        raise DeltaUnavailable(f"Манифест недоступен: {resp.status_code} {resp.reason}")
+    manifest = resp.json()
+    if not manifest.get('blocks') or not manifest.get('block_size'):
+        raise DeltaUnavailable("Пустой манифест")
+    return manifest
+
+
+def plan_ranges(manifest, index):
+    """Отрезки новой версии: ('local', смещение) или ('remote', первый блок, число блоков)"""
+    plan = []
+    for number, digest in enumerate(manifest['blocks']):
+        offset = index.get(digest)
+        if offset is not None:
+            plan.append(('local', number, offset))
+        elif plan and plan[-1][0] == 'remote':
+            kind, first, count = plan[-1]
+            plan[-1] = (kind, first, count + 1)
+        else:
+            plan.append(('remote', number, 1))
+    return plan
+
+
+def fetch_range(url, start, end, session=requests, timeout=30):
+    """Байты [start, end] файла по HTTP Range"""
+    resp = session.get(url, headers={'Range': f"bytes={start}-{end}"}, timeout=timeout)
+    if resp.status_code != 206:
+        # 200 означает, что сервер игнорирует Range и отдаёт файл целиком
+        raise DeltaUnavailable(f"Сервер не поддерживает Range: {resp.status_code} {resp.reason}")
+    data = resp.content
+    if len(data) != end - start + 1:
+        raise DeltaUnavailable(f"Получено {len(data)} байт вместо {end - start + 1}")
+    return data
+
+
+def download_delta(url, local_path, target_path, session=requests):
+    """Сборка новой версии target_path из блоков local_path и скачанных блоков.
+
+    Возвращает (переиспользовано байт, скачано байт).
+    """
+    manifest = fetch_manifest(url, session)
+    block_size = manifest['block_size']
+    size = manifest['size']
+    index = local_index(local_path, block_size)
+    plan = plan_ranges(manifest, index)
+    reused = fetched = 0
+    whole = hashlib.sha256()
+    with open(local_path, 'rb') as local, open(target_path, 'wb') as target:
+        for step in plan:
+            if step[0] == 'local':
+                _, number, offset = step
+                local.seek(offset)
+                data = local.read(min(block_size, size - number * block_size))
+                reused += len(data)
+            else:
+                _, first, count = step
+                start = first * block_size
+                end = min(size, (first + count) * block_size) - 1
+                data = fetch_range(url, start, end, session)
+                for i in range(count):
+                    block = data[i * block_size:(i + 1) * block_size]
+                    if hashlib.sha256(block).hexdigest() != manifest['blocks'][first + i]:
+                        raise DeltaUnavailable(f"Блок {first + i} не совпал с манифестом")
+                fetched += len(data)
+            whole.update(data)
+            target.write(data)
+    if whole.hexdigest() != manifest['sha256'] or os.path.getsize(target_path) != size:
+        os.remove(target_path)
+        raise DeltaUnavailable("Хеш собранного файла не совпал с манифестом")
+    logger.info(
+        f"Дельта-обновление: переиспользовано {reused} байт, скачано {fetched} байт "
+        f"({fetched * 100 // max(size, 1)}% файла)"
+    )
+    return reused, fetched
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != 'make':
+        print("Использование: python delta.py make <exe> [<exe> ...]")
+        sys.exit(2)
+    for exe in sys.argv[2:]:
+        print(write_manifest(exe))
@@ -0,0 +1,211 @@
+"""Общий слой загрузки для апдейтера и установщика.
+
+- обрыв соединения не начинает загрузку заново: докачка по HTTP Range;
+- SHA-256 считается на лету и сверяется с опубликованным хешем
+  (<url>.sha256 рядом с файлом или значение из конфигурации);
+- проверенные файлы хранятся в локальном кэше по хешу содержимого,
+  поэтому один и тот же exe не скачивается дважды — ни апдейтером,
+  ни установщиком.
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import sys
+
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+# Мелкие порции чтения из сети: при обрыве теряется не больше одной
+NETWORK_CHUNK = 64 * 1024
+DIGEST_SUFFIX = '.sha256'
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadError(Exception):
+    """Файл не удалось скачать или он не прошёл проверку"""
+
+
+def default_cache_dir():
+    """Кэш, общий для всех программ EKiller на машине"""
+    if sys.platform == 'win32':
+        root = os.environ.get('PROGRAMDATA', r'C:\ProgramData')
+        return os.path.join(root, 'EKiller', 'cache')
+    return os.path.join(os.path.expanduser('~'), '.cache', 'ekiller')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_digest(text):
+    """Хеш из файла .sha256 (формат sha256sum: «<хеш>  <имя>»)"""
+    token = text.strip().split()[0].lower() if text.strip() else ''
+    return token if re.fullmatch(r'[0-9a-f]{64}', token) else None
+
+
+class Downloader:
+    """Загрузка с докачкой, проверкой SHA-256 и кэшем по хешу содержимого"""
+
+    def __init__(self, cache_dir=None, session=None, retries=3, timeout=30, max_cache_mb=1024):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.session = session or requests.Session()
+        self.retries = retries
+        self.timeout = timeout
+        self.max_cache_bytes = max_cache_mb * 1024 * 1024
+
+    def cache_path(self, digest):
+        return os.path.join(self.cache_dir, 'sha256', digest[:2], digest)
+
+    def partial_path(self, url, digest):
+        key = digest or hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, 'partial', key + '.part')
+
+    def published_digest(self, url):
+        """Хеш из <url>.sha256 или None, если он не опубликован"""
+        try:
+            resp = self.session.get(url + DIGEST_SUFFIX, timeout=10)
+        except requests.RequestException as e:
+            logger.info(f"Хеш {url} недоступен: {e}")
+            return None
+        if resp.status_code != 200:
+            return None
+        return parse_digest(resp.text)
+
+    def restore(self, digest, target_path):
+        """Копия файла из кэша; False, если его там нет"""
+        cached = self.cache_path(digest)
+        if not os.path.exists(cached):
+            return False
+        if file_sha256(cached) != digest:
+            # Повреждённая запись кэша
+            os.remove(cached)
+            return False
+        # Время изменения — порядок вытеснения из кэша
+        os.utime(cached)
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        shutil.copyfile(cached, target_path)
+        logger.info(f"Взято из кэша: {os.path.basename(target_path)} ({digest[:12]})")
+        return True
+
+    def store(self, path, digest=None):
+        """Помещение проверенного файла в кэш"""
+        digest = digest or file_sha256(path)
+        cached = self.cache_path(digest)
+        if not os.path.exists(cached):
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            shutil.copyfile(path, cached + '.tmp')
+            os.replace(cached + '.tmp', cached)
+            self.prune()
+        return digest
+
+    def fetch(self, url, target_path, sha256=None, progress=None):
+        """Скачивание url в target_path.
+
+        sha256 — ожидаемый хеш; если не задан, берётся из <url>.sha256.
+        progress(получено, всего) вызывается по мере загрузки.
+        """
+        digest = (sha256 or '').lower() or self.published_digest(url)
+        if digest and self.restore(digest, target_path):
+            if progress:
+                size = os.path.getsize(target_path)
+                progress(size, size)
+            return target_path
+        part = self.partial_path(url, digest)
+        os.makedirs(os.path.dirname(part), exist_ok=True)
+        for attempt in range(self.retries + 1):
+            try:
+                actual = self._download(url, part, bool(digest), progress)
+                break
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.retries:
+                    raise DownloadError(f"Не удалось скачать {url}: {e}")
+                received = os.path.getsize(part) if os.path.exists(part) else 0
+                logger.info(f"Обрыв загрузки {url} ({e}), докачиваю с {received} байт")
+        if digest and actual != digest:
+            os.remove(part)
+            raise DownloadError(f"Хеш {url} не совпал: ожидался {digest}, получен {actual}")
+        if not digest:
+            logger.info(f"Для {url} не опубликован хеш, проверен только размер")
+        self.store(part, actual)
+        if os.path.exists(part + '.etag'):
+            os.remove(part + '.etag')
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        os.replace(part, target_path)
+        return target_path
+
+    def _download(self, url, part, verified, progress):
+        """Загрузка (или докачка) в part; возвращает SHA-256 всего файла.
+
+        Без ожидаемого хеша (verified=False) докачка идёт только с If-Range
+        по сохранённому ETag, чтобы не склеить части разных версий файла.
+        """
+        digest = hashlib.sha256()
+        offset = 0
+        headers = {}
+        etag_path = part + '.etag'
+        etag = None
+        if os.path.exists(etag_path):
+            with open(etag_path, encoding='utf-8') as f:
+                etag = f.read().strip() or None
+        if os.path.exists(part) and (verified or etag):
+            # Досчитываем хеш уже полученной части
+            with open(part, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    offset += len(chunk)
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+            if etag:
+                headers['If-Range'] = etag
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as resp:
+            if resp.status_code == 416 and offset:
+                # Часть уже содержит файл целиком
+                return digest.hexdigest()
+            if resp.status_code == 200 and offset:
+                # Сервер не поддерживает Range — начинаем сначала
+                digest = hashlib.sha256()
+                offset = 0
+            elif resp.status_code not in (200, 206):
+                raise DownloadError(f"Ошибка загрузки {url}: {resp.status_code} {resp.reason}")
+            if resp.headers.get('ETag'):
+                with open(etag_path, 'w', encoding='utf-8') as f:
+                    f.write(resp.headers['ETag'])
+            elif os.path.exists(etag_path):
+                os.remove(etag_path)
+            total = None
+            if resp.headers.get('Content-Length'):
+                total = offset + int(resp.headers['Content-Length'])
+            received = offset
+            with open(part, 'ab' if offset else 'wb') as f:
+                for chunk in resp.iter_content(NETWORK_CHUNK):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+                    if progress:
+                        progress(received, total)
+        if total is not None and received != total:
+            raise requests.exceptions.ChunkedEncodingError(f"получено {received} байт из {total}")
+        return digest.hexdigest()
+
+    def prune(self):
+        """Удаление самых старых файлов кэша сверх max_cache_mb"""
+        root = os.path.join(self.cache_dir, 'sha256')
+        entries = []
+        for folder, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(folder, name)
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            os.remove(path)
+            total -= size
@@ -1,11 +1,13 @@
 import requests
 import os
-import shutil
 import sys
 import subprocess
 import json
 import time
+import random
 import logging
+from delta import DeltaUnavailable, download_delta
+from downloader import Downloader
 
 if getattr(sys, 'frozen', False):
     # Если запущено из exe
@@ -30,36 +32,96 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Одно HTTP-соединение на все проверки и загрузки (keep-alive)
+SESSION = requests.Session()
+# Последний versions.json и его валидаторы для условных запросов
+VERSIONS_CACHE = {}
 
 
 def load_config():
     with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def get_remote_versions(config):
+def get_remote_versions(config, wait=None):
+    """versions.json и признак того, что он изменился с прошлой проверки.
+
+    Запрос условный (If-None-Match / If-Modified-Since): на 304 сервер не
+    передаёт файл заново. wait — long-poll: сервер с поддержкой
+    Prefer: wait держит запрос до изменения файла, но не дольше wait секунд.
+    """
     update_server = config["update_server"]
     url = update_server.rstrip('/') + "/versions.json"
-    resp = requests.get(url, timeout=10)
-    return json.loads(resp.text)
+    headers = {}
+    if VERSIONS_CACHE.get('etag'):
+        headers['If-None-Match'] = VERSIONS_CACHE['etag']
+    if VERSIONS_CACHE.get('last_modified'):
+        headers['If-Modified-Since'] = VERSIONS_CACHE['last_modified']
+    timeout = 10
+    if wait:
+        headers['Prefer'] = f"wait={int(wait)}"
+        timeout = wait + 10
+    resp = SESSION.get(url, headers=headers, timeout=timeout)
+    if resp.status_code == 304 and 'versions' in VERSIONS_CACHE:
+        logger.info("versions.json не изменился")
+        return VERSIONS_CACHE['versions'], False
+    resp.raise_for_status()
+    versions = json.loads(resp.text)
+    changed = versions != VERSIONS_CACHE.get('versions')
+    VERSIONS_CACHE.update(
+        versions=versions,
+        etag=resp.headers.get('ETag'),
+        last_modified=resp.headers.get('Last-Modified')
+    )
+    return versions, changed
+
+
+def next_check_delay(config):
+    """Интервал до следующей проверки со случайным разбросом ±interval_jitter"""
+    interval = config.get('interval_hours', 1) * 3600
+    jitter = config.get('interval_jitter', 0.1)
+    return interval * random.uniform(1 - jitter, 1 + jitter)
+
+
+def check_updates(config, wait=None):
+    """Одна проверка обновлений; возвращает True, если versions.json изменился"""
+    remote_versions, changed = get_remote_versions(config, wait)
+    if changed and wait:
+        # Все хосты узнают о выпуске одновременно — разносим загрузки во времени
+        delay = random.uniform(0, config.get('rollout_spread_seconds', 60))
+        logger.info(f"Обнаружена новая версия, загрузка через {delay:.0f} с")
+        time.sleep(delay)
+    update_client(config, remote_versions)
+    update_server(config, remote_versions)
+    return changed
 
 def download_new_exe(exe_name, config):
     update_server = config["update_server"]
     remote_prefix = config.get("remote_path_prefix", "")
     url = f"{update_server.rstrip('/')}/{remote_prefix.strip('/')}/{exe_name}"
-    logger.info(f"Скачиваю: {url}")
-
-    resp = requests.get(url, stream=True, timeout=30)
-    logger.info(f"HTTP статус: {resp.status_code} {resp.reason}")
-    if resp.status_code != 200:
-        raise Exception(f"Ошибка загрузки: {resp.status_code} {resp.reason}")
-
     new_name = os.path.join(BASE_DIR, exe_name.replace('.exe', '_new.tmp'))
+    local_path = os.path.join(BASE_DIR, exe_name)
     logger.info(f"Будет сохранён как: {new_name}")
 
-    with open(new_name, "wb") as f:
-        shutil.copyfileobj(resp.raw, f)
-        logger.info("Копирование новой версии завершено")
+    downloader = Downloader(config.get("cache_dir"), session=SESSION, max_cache_mb=config.get("cache_max_mb", 1024))
+    digest = downloader.published_digest(url)
+    # Эта версия уже скачивалась (апдейтером или установщиком)
+    if digest and downloader.restore(digest, new_name):
+        return new_name
+
+    # Затем пробуем скачать только изменившиеся блоки
+    if config.get("delta_updates", True) and os.path.exists(local_path):
+        try:
+            logger.info(f"Дельта-обновление: {url}")
+            download_delta(url, local_path, new_name, SESSION)
+            if digest is None or downloader.store(new_name) == digest:
+                return new_name
+            logger.info("Собранный файл не совпал с опубликованным хешем")
+        except (DeltaUnavailable, requests.RequestException, ValueError) as e:
+            logger.info(f"Дельта-обновление невозможно, скачиваю целиком: {e}")
 
+    logger.info(f"Скачиваю: {url}")
+    downloader.fetch(url, new_name, digest)
+    logger.info("Копирование новой версии завершено")
     return new_name
 
 
@@ -94,10 +156,15 @@ def update_server(config, remote_versions):
         logger.info(f"Доступно обновление сервера: {local_ver} -> {remote_ver}")
         new_name = download_new_exe(exe_name, config)
         logger.info(f"Заменяю {exe_path} ← {new_name}")
+        if config.get("server_handoff", True) and handoff_server(exe_path, new_name, config):
+            logger.info("Обновляю версию сервера...")
+            update_config_version("local_server_version", remote_ver)
+            return
         logger.info("Останавливаю сервис...")
         subprocess.run(["sc", "stop", service_name], check=False)
         time.sleep(4)
-        if replace_exe(exe_path, new_name) == 0:
+        # Если передача не удалась после подмены, новый exe уже на месте
+        if not os.path.exists(new_name) or replace_exe(exe_path, new_name) == 0:
             logger.info("Обновляю версию сервера...")
             update_config_version("local_server_version", remote_ver)
         logger.info("Запускаю сервис...")
@@ -105,6 +172,43 @@ def update_server(config, remote_versions):
     else:
         logger.info("Обновление сервера не требуется.")
 
+def handoff_server(exe_path, new_name, config):
+    """Обновление сервера без остановки службы.
+
+    Запущенный exe нельзя перезаписать, но можно переименовать, поэтому
+    старая версия откладывается в <exe>.old. Новая версия запускается с
+    --takeover и забирает слушающий сокет у службы, та доводит принятые
+    команды и выходит. nssm перезапускает службу уже с новым exe, и она
+    тем же способом забирает сокет у временного экземпляра.
+    Возвращает False, если сервер нужно обновить остановкой службы.
+    """
+    old_path = exe_path + '.old'
+    try:
+        if os.path.exists(old_path):
+            os.remove(old_path)
+        os.replace(exe_path, old_path)
+        os.replace(new_name, exe_path)
+    except OSError as e:
+        logger.info(f"Подмена exe без остановки невозможна: {e}")
+        if not os.path.exists(exe_path) and os.path.exists(old_path):
+            os.replace(old_path, exe_path)
+        return False
+    if sys.platform == 'win32':
+        options = {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        options = {'start_new_session': True}
+    logger.info("Запускаю новую версию сервера с передачей сокета...")
+    proc = subprocess.Popen([exe_path, '--takeover'], cwd=os.path.dirname(exe_path), **options)
+    try:
+        # Без работающего экземпляра --takeover сразу завершается
+        proc.wait(timeout=config.get("server_handoff_timeout", 15))
+    except subprocess.TimeoutExpired:
+        logger.info("Новая версия сервера приняла подключения")
+        return True
+    logger.info(f"Передача сокета не состоялась (код {proc.returncode})")
+    return False
+
+
 def restart_service(service_name):
     # Останавливаем службу
     subprocess.run(["sc", "stop", service_name], check=False)
@@ -145,18 +249,27 @@ def main():
     try:
         config = load_config()
         interval_hours = config.get('interval_hours', 1)
-        logger.info(f"Интервал проверки обновлений: {interval_hours} ч.")
+        logger.info(f"Интервал проверки обновлений: {interval_hours} ч., режим: {config.get('poll_mode', 'interval')}")
+        # Хосты, включённые одновременно, не должны опрашивать сервер синхронно
+        time.sleep(random.uniform(0, config.get('interval_jitter', 0.1) * interval_hours * 3600))
         while True:
+            started = time.monotonic()
+            wait = None
             try:
                 config = load_config()  # перечитываем на случай изменения
-                remote_versions = get_remote_versions(config)
+                if config.get('poll_mode', 'interval') == 'long-poll':
+                    wait = config.get('long_poll_seconds', 300)
                 logger.info("Проверяю обновления...")
-                update_client(config, remote_versions)
-                update_server(config, remote_versions)
-                logger.info("Проверка завершена. Следующая через %d ч.", interval_hours)
+                changed = check_updates(config, wait)
+                # Сервер держал запрос (или версия сменилась) — сразу ждём следующего изменения;
+                # быстрый ответ без изменений значит, что long-poll не поддерживается
+                if wait and (changed or time.monotonic() - started >= wait / 2):
+                    continue
             except Exception as e:
                 logger.info(f"Ошибка обновления: {e}")
-            time.sleep(interval_hours * 3600)
+            delay = next_check_delay(config)
+            logger.info(f"Проверка завершена. Следующая через {delay / 60:.0f} мин.")
+            time.sleep(delay)
     except Exception as e:
         logger.info(f"Ошибка запуска updater: {e}")
 